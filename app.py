@@ -1,21 +1,267 @@
 import streamlit as st
 import re
 import base64
+import bisect
+import codecs
 from io import BytesIO
 import pandas as pd
-from PIL import Image
+from PIL import Image, ImageChops
 import io
 import markdown
 import pdfkit
 from html2image import Html2Image
 import os
+import pathlib
 import json
+import sys
 import uuid
 import time
 import docx
 from docx.shared import Pt
 from streamlit_ace import st_ace
 import datetime
+import difflib
+import functools
+import hashlib
+import logging
+import mmap
+import shutil
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import zipfile
+import zlib
+from abc import ABC, abstractmethod
+from array import array
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Byte range handed to each worker during JSONL ingestion
+JSONL_RANGE_SIZE = 64 * 1024 * 1024
+# How much of a memory-mapped range is processed before its pages are released
+JSONL_RELEASE_INTERVAL = 16 * 1024 * 1024
+# Characters read at a time when streaming a JSON array
+JSON_STREAM_CHUNK = 1024 * 1024
+
+# Equation kinds stored in EquationIndex.kinds
+EQ_INLINE = 0
+EQ_DISPLAY = 1
+
+# Per-session memory caps (override with environment variables)
+SESSION_MAX_BYTES = int(os.environ.get("LATEX_CONVERTER_SESSION_MAX_BYTES", 64 * 1024 * 1024))
+MAX_INPUT_CHARS = int(os.environ.get("LATEX_CONVERTER_MAX_INPUT_CHARS", 5_000_000))
+# Sessions not seen for this long are dropped from the memory registry
+SESSION_REGISTRY_TTL = 3600
+# Setting this enables the memory admin view at ?admin=<token>
+ADMIN_TOKEN = os.environ.get("LATEX_CONVERTER_ADMIN_TOKEN")
+# Derived data kept in session_state that can always be rebuilt, evicted after history
+SESSION_CACHE_KEYS = ("equation_index", "markdown_blocks", "history_head")
+# The editor widget's state mirrors user_input and can't be evicted, so the cap leaves it out.
+# Its key carries a generation number that is bumped to replace the editor's content.
+EDITOR_KEY_PREFIX = "input_area_"
+# History snapshots are taken once editing has been idle this long (or on explicit actions)
+# and stored as line deltas against the previous snapshot, with a full copy every few entries
+HISTORY_MAX_ENTRIES = 20
+HISTORY_IDLE_SECONDS = 5
+HISTORY_REBASE_INTERVAL = 5
+
+# Image export: render width, tile height and how many tiles at most
+IMAGE_WIDTH = 900
+IMAGE_TILE_HEIGHT = 1200
+IMAGE_MAX_TILES = 200
+# Tiles captured per browser launch; the page is shot in strips this many tiles tall
+IMAGE_STRIP_TILES = 8
+# A stitched image above this many pixels is delivered as a page sequence instead
+IMAGE_MAX_STITCHED_PIXELS = 40_000_000
+IMAGE_FORMATS = {
+    "PNG": {"extension": "png", "mime": "image/png", "max_dimension": 65500},
+    "WebP": {"extension": "webp", "mime": "image/webp", "max_dimension": 16383},
+    "JPEG": {"extension": "jpg", "mime": "image/jpeg", "max_dimension": 65500},
+}
+IMAGE_PRESETS = {
+    "High quality": {"quality": 95, "scale": 1.0},
+    "Balanced": {"quality": 85, "scale": 0.75},
+    "Small file": {"quality": 70, "scale": 0.5},
+}
+
+# Editor changes are converted once typing pauses for DEBOUNCE_MS, and never
+# later than LATENCY_BUDGET_MS after the first unconverted keystroke
+DEBOUNCE_MS = int(os.environ.get("LATEX_CONVERTER_DEBOUNCE_MS", 600))
+LATENCY_BUDGET_MS = int(os.environ.get("LATEX_CONVERTER_LATENCY_BUDGET_MS", 3000))
+
+# Page sizes in CSS pixels at 96 dpi, portrait
+PAGE_SIZES_PX = {"A4": (794, 1123), "Letter": (816, 1056), "Legal": (816, 1344), "Tabloid": (1056, 1632)}
+EXPORT_THEMES = {
+    "Light": {"background": "#ffffff", "color": "#212529", "code_background": "#f5f5f5"},
+    "Dark": {"background": "#1a1a1a", "color": "#e0e0e0", "code_background": "#2d2d2d"},
+}
+
+# Finished export artifacts are cached on disk (override with environment variables)
+EXPORT_CACHE_DIR = os.environ.get(
+    "LATEX_CONVERTER_EXPORT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "latex_converter_exports")
+)
+EXPORT_CACHE_MAX_BYTES = int(os.environ.get("LATEX_CONVERTER_EXPORT_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+EXPORT_CACHE_MAX_ENTRIES = int(os.environ.get("LATEX_CONVERTER_EXPORT_CACHE_MAX_ENTRIES", 1000))
+# Cache shared by all app processes: SQLite on this host, or Redis when a URL is given
+SHARED_CACHE_PATH = os.environ.get(
+    "LATEX_CONVERTER_SHARED_CACHE_PATH", os.path.join(tempfile.gettempdir(), "latex_converter_cache.sqlite3")
+)
+SHARED_CACHE_REDIS_URL = os.environ.get("LATEX_CONVERTER_REDIS_URL")
+SHARED_CACHE_TTL = int(os.environ.get("LATEX_CONVERTER_SHARED_CACHE_TTL", 24 * 3600))
+SHARED_CACHE_MAX_BYTES = int(os.environ.get("LATEX_CONVERTER_SHARED_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+# A worker computing a value holds its lease this long at most; others wait up to the wait time
+SHARED_CACHE_LEASE_SECONDS = 120
+SHARED_CACHE_WAIT_SECONDS = 60
+# Smaller documents convert faster than a cache round trip
+SHARED_CACHE_MIN_CHARS = 20_000
+# Exports refused while the input has equation errors, unless overridden
+VALIDATED_EXPORTS = ("PDF", "Image")
+# Editor annotations and listed problems are capped to keep reruns light
+MAX_DIAGNOSTICS_SHOWN = 200
+# Export settings, the widgets that set them, and the defaults used outside the UI
+DEFAULT_EXPORT_SETTINGS = {
+    "page_size": "A4",
+    "orientation": "Portrait",
+    "theme": "Light",
+    "image_format": "JPEG",
+    "image_preset": "Balanced",
+    "image_layout": "Single image",
+    "html_self_contained": False,
+    "pdf_parallel": False,
+}
+EXPORT_SETTING_WIDGETS = {
+    "page_size": "export_page_size",
+    "orientation": "export_orientation",
+    "theme": "export_theme",
+    "image_format": "image_format",
+    "image_preset": "image_preset",
+    "image_layout": "image_layout",
+    "html_self_contained": "export_self_contained",
+    "pdf_parallel": "export_pdf_parallel",
+}
+# Formats worth caching, and the export settings each one depends on
+EXPORT_CACHE_SETTINGS = {
+    "HTML": ("theme", "html_self_contained"),
+    "PDF": ("page_size", "orientation", "theme", "pdf_parallel"),
+    "Image": ("page_size", "orientation", "theme", "image_format", "image_preset", "image_layout"),
+    "Word": (),
+}
+
+# MathJax 2 (MathJax 3 needs a newer browser engine than wkhtmltopdf's), vendored into
+# static/ by vendor_mathjax.py and served by Streamlit at /app/static/mathjax/<version>/
+MATHJAX_VERSION = "2.7.7"
+MATHJAX_CONFIG = "TeX-MML-AM_CHTML"
+MATHJAX_CDN_URL = f"https://cdnjs.cloudflare.com/ajax/libs/mathjax/{MATHJAX_VERSION}/MathJax.js"
+MATHJAX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "mathjax", MATHJAX_VERSION)
+# Where downloaded HTML pages load MathJax from, e.g. https://<this app>/app/static/mathjax/2.7.7/MathJax.js
+MATHJAX_URL = os.environ.get("LATEX_CONVERTER_MATHJAX_URL", MATHJAX_CDN_URL)
+# Exports whose pages load MathJax, so their cached artifacts depend on its source
+MATHJAX_EXPORTS = ("HTML", "PDF", "Image")
+# CommonHTML web fonts: family the output uses for a web font, and its file in fonts/HTML-CSS/TeX/woff
+MATHJAX_FONTS = {
+    "main-R": "MathJax_Main-Regular", "main-B": "MathJax_Main-Bold", "main-I": "MathJax_Main-Italic",
+    "math-I": "MathJax_Math-Italic", "math-BI": "MathJax_Math-BoldItalic", "ams-R": "MathJax_AMS-Regular",
+    "cal-R": "MathJax_Caligraphic-Regular", "cal-B": "MathJax_Caligraphic-Bold",
+    "frak-R": "MathJax_Fraktur-Regular", "frak-B": "MathJax_Fraktur-Bold",
+    "sans-R": "MathJax_SansSerif-Regular", "sans-B": "MathJax_SansSerif-Bold", "sans-I": "MathJax_SansSerif-Italic",
+    "script-R": "MathJax_Script-Regular", "type-R": "MathJax_Typewriter-Regular",
+    "size1-R": "MathJax_Size1-Regular", "size2-R": "MathJax_Size2-Regular",
+    "size3-R": "MathJax_Size3-Regular", "size4-R": "MathJax_Size4-Regular",
+    "vec-R": "MathJax_Vector-Regular", "vec-B": "MathJax_Vector-Bold",
+}
+# Fonts every equation may need, then the fonts pulled in by particular commands
+MATHJAX_BASE_FONTS = ("main-R", "math-I", "size1-R")
+MATHJAX_COMMAND_FONTS = [
+    (re.compile(r'\\(mathbf|bf|textbf|boldsymbol|pmb)\b'), ("main-B", "math-BI")),
+    (re.compile(r'\\(mathit|textit|it|emph)\b'), ("main-I",)),
+    (re.compile(r'\\(mathbb|Bbb|varnothing|geqslant|leqslant|lesssim|gtrsim|nmid|nparallel|because|therefore|'
+                r'square|blacksquare|checkmark|complement|mho|beth|gimel|daleth|circledR|yen|maltese|ulcorner|'
+                r'urcorner|llcorner|lrcorner|varkappa|digamma|backprime|varpropto|smallsetminus|nleq|ngeq|'
+                r'subsetneq|supsetneq|lneq|gneq|triangleq|eqslantless|eqslantgtr|leftleftarrows|rightrightarrows)\b'),
+     ("ams-R",)),
+    (re.compile(r'\\mathcal\b'), ("cal-R",)),
+    (re.compile(r'\\mathfrak\b'), ("frak-R",)),
+    (re.compile(r'\\mathscr\b'), ("script-R",)),
+    (re.compile(r'\\(mathsf|textsf)\b'), ("sans-R",)),
+    (re.compile(r'\\(mathtt|texttt)\b'), ("type-R",)),
+    (re.compile(r'\\vec\b'), ("vec-R",)),
+    # Stretchy delimiters and tall constructs reach for the bigger size fonts
+    (re.compile(r'\\(left|right|bigg|Bigg|Big|big|begin\{(p|b|B|v|V)?matrix\}|begin\{cases\}|sqrt)'),
+     ("size2-R", "size3-R", "size4-R")),
+]
+
+# Formats bundled by "Export All Formats"
+EXPORT_ALL_FORMATS = ("HTML", "Markdown", "PDF", "Image", "LaTeX", "Word", "Plain Text")
+
+# Parallel PDF: documents are split at top-level h1/h2 headings into shards of at least
+# this much HTML, one wkhtmltopdf process each, and merged with pypdf
+PDF_SHARD_MIN_CHARS = 100_000
+PDF_SHARD_WORKERS = int(os.environ.get("LATEX_CONVERTER_PDF_WORKERS", os.cpu_count() or 1))
+
+# Speculative pre-rendering: once the output has been stable this long, the formats the
+# user clicks most are rendered in the background so the click is served from the cache
+PRERENDER_ENABLED = os.environ.get("LATEX_CONVERTER_PRERENDER", "1") != "0"
+PRERENDER_STABLE_SECONDS = 3
+PRERENDER_TOP_FORMATS = 2
+# Speculation waits while the 1-minute load average per core is above this...
+PRERENDER_MAX_LOAD = float(os.environ.get("LATEX_CONVERTER_PRERENDER_MAX_LOAD", 0.7))
+# ...and may use this share of one core on average, saved up to PRERENDER_CPU_BURST seconds.
+# Time spent waiting for renderer subprocesses is charged in full, as if it were CPU time.
+PRERENDER_CPU_SHARE = float(os.environ.get("LATEX_CONVERTER_PRERENDER_CPU_SHARE", 0.25))
+PRERENDER_CPU_BURST = 30.0
+
+# Watch mode: which files are converted, and where the manifest is kept in the output folder
+WATCH_EXTENSIONS = (".md", ".txt", ".tex")
+WATCH_MANIFEST_NAME = ".latex_watch_manifest.json"
+
+# Documents above either limit get the windowed preview and editor
+LARGE_DOCUMENT_CHARS = 200_000
+LARGE_DOCUMENT_BLOCKS = 400
+# Blocks rendered per preview window, and the most kept rendered at once
+PREVIEW_WINDOW_BLOCKS = 40
+PREVIEW_MAX_BLOCKS = 120
+
+_LINE = re.compile(r'[^\n]*\n|[^\n]+')
+
+# Large-file upload: read size, carry limit for openers awaiting a closer, result page size
+UPLOAD_EXTENSIONS = ("md", "txt", "tex", "json")
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+STREAM_MAX_CARRY = 4 * 1024 * 1024
+UPLOAD_PAGE_CHARS = 50_000
+UPLOAD_DIR = os.path.join(tempfile.gettempdir(), "latex_converter_uploads")
+
+# Markdown render units and their HTML are kept per process up to this many characters
+MARKDOWN_BLOCK_CACHE_CHARS = int(os.environ.get("LATEX_CONVERTER_MARKDOWN_CACHE_CHARS", 32 * 1024 * 1024))
+# Blocks are rendered in units of about this many, cut at content-defined points
+# so an edit only invalidates the unit it falls in
+MARKDOWN_UNIT_BLOCKS = 8
+# Constructs that refer across blocks (link references, footnotes, abbreviations)
+# or span them (raw HTML blocks, which may hold markdown="1" content)
+_MARKDOWN_GLOBAL_REFS = re.compile(r'^ {0,3}(\[[^\]]+\]:|\*\[|<[a-zA-Z/!])|\[\^', re.MULTILINE)
+# A block starting like this continues the one before it (lists, indented code, definitions);
+# like Python-Markdown, only a full tab stop of indentation counts
+_MARKDOWN_CONTINUATION = re.compile(r' {4}|\t|: ')
+# Blocks that join a list, blockquote or definition list right before them
+_MARKDOWN_BLOCK_KINDS = (
+    ("list", re.compile(r' {0,3}([-*+]|\d+\.)[ \t]').match),
+    ("quote", re.compile(r' {0,3}>').match),
+    ("definitions", re.compile(r'^ {0,3}:[ \t]', re.MULTILINE).search),
+)
+
+# Tokens the equation validator looks at; \\. skips escaped characters such as \\{ and \\\\
+_LATEX_TOKEN = re.compile(r'\\(?:left|right)(?![a-zA-Z])|\\[\[(]|\\.|[{}$]', re.DOTALL)
+# Top-level h1/h2 headings are shard boundaries; ones inside containers are not
+_HTML_SECTION_TOKEN = re.compile(r'<(/?)(?:blockquote|details|div|ol|table|ul)\b|^(?=<h[12][\s>])', re.IGNORECASE | re.MULTILINE)
+# Display spans are found first; inline spans only in the text between them
+_DISPLAY_EQUATION = re.compile(r'\$\$(.*?)\$\$', re.DOTALL)
+_INLINE_EQUATION = re.compile(r'(?<!\$)\$(?!\$)(.*?)(?<!\$)\$(?!\$)', re.DOTALL)
+_EQUATION_PLACEHOLDER = re.compile(r'(DISPLAY|INLINE)_EQ_(\d+)')
+
+_JSON_TOKEN = re.compile(r'"(?:[^"\\]++|\\.)*+"|[\[\]{},"]', re.DOTALL)
 
 # Initialize session state if needed
 if 'history' not in st.session_state:
@@ -27,23 +273,294 @@ if 'session_id' not in st.session_state:
 if 'theme' not in st.session_state:
     st.session_state.theme = "light"
 
-def convert_latex_to_markdown(text):
+def _diagnostic(diagnostics, start, end, severity, message, fix):
+    diagnostics.append({"start": start, "end": end, "type": severity, "message": message, "fix": fix})
+
+def _validate_equation(text, start, end, display, diagnostics):
+    """Check one equation's braces, \\left/\\right pairs and delimiters in a single scan of its tokens."""
+    braces = []   # Offsets of open {
+    lefts = []    # (offset, brace depth) of open \left
+    name = "display" if display else "inline"
+    for token in _LATEX_TOKEN.finditer(text, start, end):
+        kind = token.group()
+        pos = token.start()
+        if kind == "{":
+            braces.append(pos)
+        elif kind == "}":
+            if braces:
+                braces.pop()
+            else:
+                _diagnostic(diagnostics, pos, pos + 1, "error", "Unmatched closing brace '}'",
+                            "Remove it or add a matching '{' before it")
+        elif kind == "\\left":
+            lefts.append((pos, len(braces)))
+        elif kind == "\\right":
+            if not lefts:
+                _diagnostic(diagnostics, pos, pos + 6, "error", "\\right without a matching \\left",
+                            "Add a \\left before it, or use \\left. for an invisible delimiter")
+            elif lefts[-1][1] != len(braces):
+                left_pos = lefts.pop()[0]
+                _diagnostic(diagnostics, left_pos, pos + 6, "error", "\\left and \\right are in different brace groups",
+                            "Move them inside the same { ... } group")
+            else:
+                lefts.pop()
+        elif kind == "$":
+            _diagnostic(diagnostics, pos, pos + 1, "error", f"Stray '$' inside this {name} equation",
+                        "Escape it as \\$")
+        elif kind == "\\[" or kind == "\\(":
+            _diagnostic(diagnostics, pos, pos + 2, "error", f"Stray '{kind}' inside this {name} equation",
+                        "Close the previous equation first")
+    
+    for pos in braces:
+        _diagnostic(diagnostics, pos, pos + 1, "error", "Unclosed brace '{'",
+                    "Add a matching '}' before the end of the equation")
+    for pos, _ in lefts:
+        _diagnostic(diagnostics, pos, pos + 5, "error", "\\left without a matching \\right",
+                    "Add a \\right before the end of the equation, or \\right. for an invisible delimiter")
+
+def _replace_delimited(text, opener, closer, replacement, display, diagnostics=None):
+    """
+    Replace every opener ... closer pair with replacement ... replacement, like a lazy
+    regex would, in O(n): once an opener has no closer after it, no later one can.
+    """
+    parts = []
+    pos = 0
+    while True:
+        start = text.find(opener, pos)
+        if start != -1:
+            end = text.find(closer, start + 2)
+        if start == -1 or end == -1:
+            break
+        if diagnostics is not None:
+            stray = text.find(closer, pos, start)
+            if stray != -1:
+                _diagnostic(diagnostics, stray, stray + 2, "warning", f"'{closer}' without an opening '{opener}'",
+                            f"Remove it or add '{opener}' before the equation")
+            _validate_equation(text, start + 2, end, display, diagnostics)
+        parts += [text[pos:start], replacement, text[start + 2:end], replacement]
+        pos = end + 2
+    
+    if diagnostics is not None:
+        if start != -1:
+            _diagnostic(diagnostics, start, start + 2, "error", f"'{opener}' is never closed",
+                        f"Add '{closer}' after the equation")
+        else:
+            stray = text.find(closer, pos)
+            if stray != -1:
+                _diagnostic(diagnostics, stray, stray + 2, "warning", f"'{closer}' without an opening '{opener}'",
+                            f"Remove it or add '{opener}' before the equation")
+    parts.append(text[pos:])
+    return "".join(parts)
+
+def convert_latex_to_markdown(text, diagnostics=None):
     """
     Convert ChatGPT-style LaTeX delimiters to Markdown-compatible delimiters.
-    - \( ... \) → $ ... $
-    - \[ ... \] → $$ ... $$
+    - \\( ... \\) → $ ... $
+    - \\[ ... \\] → $$ ... $$
+    When a diagnostics list is given, the same scan appends a problem found in the
+    equations (offset range into text, type, message, suggested fix) for each issue.
     """
     # Convert display equations: \[ ... \] to $$ ... $$
-    text = re.sub(r'\\\[(.*?)\\\]', r'$$\1$$', text, flags=re.DOTALL)
+    # Same length as the delimiters it replaces, so offsets still match the input below
+    text = _replace_delimited(text, "\\[", "\\]", "$$", True, diagnostics)
     
     # Convert inline equations: \( ... \) to $ ... $
-    text = re.sub(r'\\\((.*?)\\\)', r'$\1$', text, flags=re.DOTALL)
+    text = _replace_delimited(text, "\\(", "\\)", "$", False, diagnostics)
     
     return text
 
+def diagnostics_to_annotations(text, diagnostics):
+    """Ace editor gutter annotations (0-based row and column) for diagnostics on text."""
+    line_starts = [0] + [m.end() for m in re.finditer("\n", text)]
+    annotations = []
+    for diagnostic in diagnostics:
+        row = bisect.bisect_right(line_starts, diagnostic["start"]) - 1
+        annotations.append({
+            "row": row,
+            "column": diagnostic["start"] - line_starts[row],
+            "type": diagnostic["type"],
+            "text": f"{diagnostic['message']}. Fix: {diagnostic['fix']}",
+        })
+    return annotations
+
+def _stream_delimited(chunks, opener, closer, replacement, display):
+    """
+    _replace_delimited over an iterable of text chunks, yielding converted text as soon as
+    later input can't change it. Search positions carry over between chunks, so each
+    character is searched once per delimiter however the input is split.
+    """
+    buffer = ""
+    start = -1       # Offset of an opener still waiting for its closer
+    opener_from = 0  # No opener starts before this offset
+    closer_from = 0  # No closer starts between the open opener and this offset
+    literal = []     # (start, end) ranges after openers given up on, left as text
+    
+    def convert(cut):
+        parts = []
+        pos = 0
+        for literal_start, literal_end in literal:
+            parts += [_replace_delimited(buffer[pos:literal_start], opener, closer, replacement, display),
+                      buffer[literal_start:literal_end]]
+            pos = literal_end
+        parts.append(_replace_delimited(buffer[pos:cut], opener, closer, replacement, display))
+        return "".join(parts)
+    
+    for chunk in chunks:
+        buffer += chunk
+        while True:
+            if start == -1:
+                start = buffer.find(opener, opener_from)
+                if start == -1:
+                    # A trailing backslash may start an opener in the next chunk
+                    opener_from = max(opener_from, len(buffer) - 1)
+                    break
+            end = buffer.find(closer, max(start + len(opener), closer_from))
+            if end != -1:
+                opener_from = end + len(closer)
+                start = -1
+                continue
+            closer_from = len(buffer) - 1
+            if len(buffer) - start <= STREAM_MAX_CARRY:
+                break
+            # No closer within STREAM_MAX_CARRY characters: leave this opener as literal text,
+            # along with every later one that is as far from the end (the text has no closer)
+            opener_from = max(start + len(opener), len(buffer) - STREAM_MAX_CARRY)
+            literal.append((start, opener_from))
+            start = -1
+        
+        cut = start if start != -1 else opener_from
+        if cut:
+            yield convert(cut)
+            buffer = buffer[cut:]
+            literal = []
+            opener_from -= cut
+            closer_from = max(0, closer_from - cut)
+            if start != -1:
+                start -= cut
+    
+    if buffer:
+        yield convert(len(buffer))
+
+def convert_latex_stream(chunks):
+    """
+    Convert an iterable of text chunks, yielding Markdown as soon as later chunks can't change it.
+    The output matches convert_latex_to_markdown on the joined text, except that an
+    opener whose closer is more than STREAM_MAX_CARRY characters away is left unconverted.
+    """
+    # Display equations first, as in convert_latex_to_markdown
+    display_converted = _stream_delimited(chunks, "\\[", "\\]", "$$", True)
+    return _stream_delimited(display_converted, "\\(", "\\)", "$", False)
+
+_markdown_renderers = threading.local()
+
+def _markdown_renderer():
+    """A Markdown converter per thread, reused between conversions."""
+    renderer = getattr(_markdown_renderers, "renderer", None)
+    if renderer is None:
+        renderer = _markdown_renderers.renderer = markdown.Markdown(extensions=['extra', 'codehilite'])
+    return renderer
+
+class TextCache:
+    """Thread-safe LRU of strings bounded by the total length of keys and values."""
+    
+    def __init__(self, max_chars):
+        self.max_chars = max_chars
+        self.entries = OrderedDict()
+        self.chars = 0
+        self.lock = threading.Lock()
+    
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+    
+    def put(self, key, value):
+        size = len(key) + len(value)
+        if size > self.max_chars // 4:
+            return  # One huge entry would flush everything else
+        with self.lock:
+            if key in self.entries:
+                return
+            self.entries[key] = value
+            self.chars += size
+            while self.chars > self.max_chars:
+                old_key, old_value = self.entries.popitem(last=False)
+                self.chars -= len(old_key) + len(old_value)
+
+@st.cache_resource
+def get_markdown_block_cache():
+    """Rendered Markdown units shared by all sessions of this worker."""
+    return TextCache(MARKDOWN_BLOCK_CACHE_CHARS)
+
+def _render_markdown_block(block):
+    """Render a run of top-level Markdown blocks (cached by its text)."""
+    cache = get_markdown_block_cache()
+    html = cache.get(block)
+    if html is None:
+        renderer = _markdown_renderer()
+        try:
+            html = renderer.convert(block)
+        finally:
+            renderer.reset()
+        cache.put(block, html)
+    return html
+
 def markdown_to_html(markdown_text):
-    """Convert markdown text to HTML."""
-    return markdown.markdown(markdown_text, extensions=['extra', 'codehilite'])
+    """
+    Convert markdown text to HTML.
+    Large documents are shared between app processes through the shared cache.
+    """
+    return shared_cached_text("html", markdown_text, lambda: _markdown_to_html(markdown_text))
+
+def _markdown_to_html(markdown_text):
+    """
+    Render markdown text block by block; each block's HTML (code highlighting included)
+    is cached, so re-rendering an edited document only renders changed blocks.
+    """
+    if _MARKDOWN_GLOBAL_REFS.search(markdown_text):
+        # References resolve across blocks, so render the document as a whole
+        return markdown.markdown(markdown_text, extensions=['extra', 'codehilite'])
+    
+    # Merge blank-line blocks that Markdown would treat as one (loose lists, indented continuations)
+    groups = []  # [start, end, kind of block the group ends in]
+    for start, end in split_markdown_blocks(markdown_text):
+        block = markdown_text[start:end]
+        kind = next((name for name, matches in _MARKDOWN_BLOCK_KINDS if matches(block)), None)
+        if groups and _MARKDOWN_CONTINUATION.match(block):
+            groups[-1][1] = end
+            if kind == "definitions":
+                # The paragraph before a definition becomes its term, in the definition list before that
+                if len(groups) > 1 and groups[-2][2] == "definitions":
+                    term_group = groups.pop()
+                    groups[-1][1] = term_group[1]
+                groups[-1][2] = kind
+        elif groups and kind is not None and groups[-1][2] == kind:
+            groups[-1][1] = end
+        else:
+            groups.append([start, end, kind])
+    
+    # Render groups in units ending where a group's checksum says so; converting
+    # each tiny block on its own would cost more than the cache saves
+    units = []
+    unit_start = None
+    for start, end, _ in groups:
+        if unit_start is None:
+            unit_start = start
+        if zlib.crc32(markdown_text[start:end].encode()) % MARKDOWN_UNIT_BLOCKS == 0:
+            units.append((unit_start, end))
+            unit_start = None
+    if unit_start is not None:
+        units.append((unit_start, groups[-1][1]))
+    
+    # Python-Markdown strips each render, dropping the newline a highlighted code block
+    # ends with; a whole-document render keeps it when more blocks follow
+    parts = []
+    for start, end in units:
+        html = _render_markdown_block(markdown_text[start:end])
+        parts.append(html + "\n" if html.endswith("</code></pre></div>") else html)
+    return "\n".join(parts).rstrip("\n")
 
 def html_to_pdf(html_content, output_path="output.pdf"):
     """Convert HTML to PDF."""
@@ -54,16 +571,938 @@ def html_to_pdf(html_content, output_path="output.pdf"):
         st.error(f"Error converting to PDF: {e}")
         return None
 
-def html_to_image(html_content, output_path="output.jpg"):
-    """Convert HTML to image."""
+def _save_image(img, path, image_format, preset):
+    """Save a PIL image with the size/quality settings of a preset."""
+    settings = IMAGE_PRESETS[preset]
+    if image_format == "JPEG":
+        img.convert("RGB").save(path, "JPEG", quality=settings["quality"], optimize=True, progressive=True)
+    elif image_format == "WebP":
+        img.save(path, "WEBP", quality=settings["quality"], method=6)
+    else:
+        if settings["quality"] < 90:
+            # Palette PNGs are a fraction of the size and fine for text and equations
+            img = img.convert("RGB").quantize(colors=256)
+        img.save(path, "PNG", optimize=True)
+
+# Once MathJax is done, paints two squares in the top-left corner: a marker colour, then the
+# page height in CSS pixels as an RGB colour, for _measure_page_height to read back
+_IMAGE_HEIGHT_PROBE = """<script>
+window.addEventListener("load", function () {
+    function report() {
+        var height = Math.ceil(document.documentElement.scrollHeight);
+        var probe = document.createElement("div");
+        probe.style.cssText = "position: fixed; left: 0; top: 0; z-index: 2147483647; display: flex;";
+        [[1, 2, 3], [(height >> 16) & 255, (height >> 8) & 255, height & 255]].forEach(function (rgb) {
+            var square = document.createElement("div");
+            square.style.cssText = "width: 8px; height: 8px; background: rgb(" + rgb.join(",") + ");";
+            probe.appendChild(square);
+        });
+        document.body.appendChild(probe);
+    }
+    if (window.MathJax && MathJax.Hub) {
+        MathJax.Hub.Queue(report);
+    } else {
+        report();
+    }
+});
+</script>"""
+
+def _measure_page_height(hti, html_content, tile_dir):
+    """Height of the rendered page in pixels, read back from one probe screenshot, or None."""
+    probe_html = os.path.join(tile_dir, "probe.html")
+    with open(probe_html, "w", encoding="utf-8") as f:
+        f.write(html_content.replace("</body>", _IMAGE_HEIGHT_PROBE + "</body>", 1))
+    hti.screenshot(url=os.path.abspath(probe_html), save_as="probe.png")
+    with Image.open(os.path.join(tile_dir, "probe.png")) as probe:
+        probe = probe.convert("RGB")
+        if probe.width < 16 or probe.getpixel((4, 4)) != (1, 2, 3):
+            return None
+        red, green, blue = probe.getpixel((12, 4))
+    return (red << 16) | (green << 8) | blue
+
+def html_to_image(html_content, output_path="output.jpg", image_format="JPEG", preset="Balanced", paged=False,
+                  width=IMAGE_WIDTH, tile_height=IMAGE_TILE_HEIGHT, background="white"):
+    """
+    Convert HTML to an image by rendering it in fixed-height tiles. The page height is
+    measured once, then the page is shot in strips of IMAGE_STRIP_TILES tiles, one
+    browser launch each, and cut into tiles. Tiles are downscaled and stitched into one image, or written as a ZIP of
+    page images when paged is True or the stitched image would be too large.
+    Returns the path written (output_path, or output_path with a .zip suffix).
+    """
     try:
-        hti = Html2Image()
-        hti.screenshot(html_str=html_content, save_as=output_path)
-        return output_path
+        scale = IMAGE_PRESETS[preset]["scale"]
+        tile_width = int(width * scale)
+        
+        with tempfile.TemporaryDirectory(prefix="image_tiles_") as tile_dir:
+            hti = Html2Image(output_path=tile_dir, size=(width, tile_height))
+            page_height = _measure_page_height(hti, html_content, tile_dir)
+            height_limit = tile_height * IMAGE_MAX_TILES
+            strip_height = tile_height * IMAGE_STRIP_TILES
+            tile_paths = []
+            total_height = 0
+            
+            for strip_num, offset in enumerate(range(0, min(page_height or height_limit, height_limit), strip_height)):
+                # Shift the page up so this strip's slice fills the viewport
+                shifted = html_content.replace(
+                    "</head>",
+                    f"<style>html {{ overflow: hidden; }} body {{ position: relative; top: -{offset}px; }}</style></head>",
+                    1,
+                )
+                strip_html = os.path.join(tile_dir, f"strip_{strip_num}.html")
+                with open(strip_html, "w", encoding="utf-8") as f:
+                    f.write(shifted)
+                viewport_height = strip_height if page_height is None else min(strip_height, page_height - offset)
+                hti.screenshot(url=os.path.abspath(strip_html), save_as=f"strip_{strip_num}.png", size=(width, viewport_height))
+                
+                with Image.open(os.path.join(tile_dir, f"strip_{strip_num}.png")) as raw_strip:
+                    strip = raw_strip.convert("RGB")
+                if page_height is None and ImageChops.difference(strip, Image.new("RGB", strip.size, background)).getbbox() is None:
+                    break  # Height unknown: a blank strip is past the end of the document
+                
+                for top in range(0, strip.height, tile_height):
+                    tile = strip.crop((0, top, strip.width, min(strip.height, top + tile_height)))
+                    if scale != 1.0:
+                        tile = tile.resize((tile_width, max(1, int(tile.height * scale))), Image.LANCZOS)
+                    scaled_path = os.path.join(tile_dir, f"scaled_{len(tile_paths)}.png")
+                    tile.save(scaled_path)
+                    tile_paths.append(scaled_path)
+                    total_height += tile.height
+                    tile.close()
+                strip.close()
+            
+            if page_height is None:
+                # Drop the blank tiles the last strip ends with and trim the one before them
+                while tile_paths:
+                    with Image.open(tile_paths[-1]) as last_tile:
+                        last_tile = last_tile.convert("RGB")
+                    content_box = ImageChops.difference(last_tile, Image.new("RGB", last_tile.size, background)).getbbox()
+                    if content_box is not None:
+                        trimmed = last_tile.crop((0, 0, last_tile.width, min(last_tile.height, content_box[3] + 20)))
+                        total_height -= last_tile.height - trimmed.height
+                        trimmed.save(tile_paths[-1])
+                        break
+                    total_height -= last_tile.height
+                    tile_paths.pop()
+            
+            if not tile_paths:
+                raise ValueError("Rendered document is empty")
+            
+            max_height = min(
+                IMAGE_FORMATS[image_format]["max_dimension"],
+                IMAGE_MAX_STITCHED_PIXELS // tile_width,
+            )
+            extension = IMAGE_FORMATS[image_format]["extension"]
+            
+            if paged or total_height > max_height:
+                # Page sequence: only one tile is ever held in memory
+                output_path = os.path.splitext(output_path)[0] + ".zip"
+                with zipfile.ZipFile(output_path, "w") as archive:
+                    for page_num, tile_path in enumerate(tile_paths, 1):
+                        page_path = os.path.join(tile_dir, f"page_{page_num:03d}.{extension}")
+                        with Image.open(tile_path) as tile:
+                            _save_image(tile, page_path, image_format, preset)
+                        archive.write(page_path, os.path.basename(page_path))
+                return output_path
+            
+            # Stitch tiles into one image of bounded size
+            canvas = Image.new("RGB", (tile_width, total_height), background)
+            y = 0
+            for tile_path in tile_paths:
+                with Image.open(tile_path) as tile:
+                    canvas.paste(tile, (0, y))
+                    y += tile.height
+            _save_image(canvas, output_path, image_format, preset)
+            canvas.close()
+            return output_path
     except Exception as e:
         st.error(f"Error converting to image: {e}")
         return None
 
+def mathjax_available():
+    """Whether vendor_mathjax.py has put a local MathJax bundle in place."""
+    return os.path.exists(os.path.join(MATHJAX_DIR, "MathJax.js"))
+
+def mathjax_fonts_used(markdown_text):
+    """The CommonHTML web fonts the equations in markdown_text are likely to need."""
+    index = EquationIndex(markdown_text)
+    if not len(index):
+        return []
+    equations = "\n".join(index.texts)
+    fonts = set(MATHJAX_BASE_FONTS)
+    for pattern, needed in MATHJAX_COMMAND_FONTS:
+        if pattern.search(equations):
+            fonts.update(needed)
+    # Display equations set big operators in the Size2 font
+    if EQ_DISPLAY in index.kinds:
+        fonts.add("size2-R")
+    return sorted(fonts)
+
+@functools.lru_cache(maxsize=None)
+def _mathjax_inline_code():
+    """MathJax.js followed by the combined configuration that preloads every component it needs."""
+    with open(os.path.join(MATHJAX_DIR, "MathJax.js"), encoding="utf-8") as f:
+        core = f.read()
+    with open(os.path.join(MATHJAX_DIR, "config", f"{MATHJAX_CONFIG}-full.js"), encoding="utf-8") as f:
+        combined = f.read()
+    # Neither may end the inline <script> element early
+    return core.replace("</script", "<\\/script"), combined.replace("</script", "<\\/script")
+
+@functools.lru_cache(maxsize=64)
+def _mathjax_font_face(font):
+    with open(os.path.join(MATHJAX_DIR, "fonts", "HTML-CSS", "TeX", "woff", f"{MATHJAX_FONTS[font]}.woff"), "rb") as f:
+        data = base64.b64encode(f.read()).decode()
+    return f"@font-face {{font-family: MJXc-TeX-{font}w; src: url(data:font/woff;base64,{data}) format('woff')}}"
+
+def mathjax_script(markdown_text, target="html", self_contained=False):
+    """
+    The <head> markup that loads MathJax for an exported page.
+    Renderers read the local bundle by file path when it is installed. A self-contained
+    page inlines MathJax and, as data URIs, only the web fonts its equations use.
+    """
+    if self_contained:
+        if not mathjax_available():
+            raise FileNotFoundError("Self-contained HTML needs the local MathJax bundle; run python vendor_mathjax.py")
+        core, combined = _mathjax_inline_code()
+        fonts = "\n".join(_mathjax_font_face(font) for font in mathjax_fonts_used(markdown_text))
+        # The combined configuration runs from AuthorInit so its components count as loaded before
+        # startup; the inlined fonts are moved after MathJax's own @font-face rules so they win
+        return f"""<style id="mathjax-fonts">{fonts}</style>
+            <script>
+            window.MathJax = {{AuthorInit: function () {{
+                {combined}
+                MathJax.Hub.Register.StartupHook("Begin Typeset", function () {{
+                    document.head.appendChild(document.getElementById("mathjax-fonts"));
+                }});
+            }}}};
+            </script>
+            <script>{core}</script>"""
+    
+    if target != "html" and mathjax_available():
+        src = pathlib.Path(MATHJAX_DIR, "MathJax.js").as_uri()
+    elif target == "html":
+        src = MATHJAX_URL
+    else:
+        src = MATHJAX_CDN_URL
+    return f'<script src="{src}?config={MATHJAX_CONFIG}" async></script>'
+
+@functools.lru_cache(maxsize=None)
+def wkhtmltopdf_version():
+    """Version of the installed wkhtmltopdf as a tuple, or () if it can't be run."""
+    try:
+        binary = pdfkit.configuration().wkhtmltopdf
+        output = subprocess.run([binary, "--version"], capture_output=True, text=True, timeout=10).stdout
+    except (OSError, subprocess.SubprocessError):
+        return ()
+    match = re.search(r'(\d+)\.(\d+)\.(\d+)', output)
+    return tuple(int(part) for part in match.groups()) if match else ()
+
+def build_export_html(markdown_text, target="html", theme="Light", html_body=None, self_contained=False):
+    """
+    Wrap rendered Markdown in a standalone HTML page with MathJax.
+    target is "html" for the downloadable page, or "pdf"/"image" for renderers.
+    """
+    colors = EXPORT_THEMES[theme]
+    if html_body is None:
+        html_body = markdown_to_html(markdown_text)
+    if target == "html":
+        pre_style = "overflow-x: auto;"
+        extra_styles = """
+                .math-container {
+                    padding: 10px 0;
+                    overflow-x: auto;
+                }"""
+    else:
+        pre_style = "white-space: pre-wrap;"
+        extra_styles = ""
+    
+    return f"""
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <title>Exported Markdown</title>
+            <meta charset="UTF-8">
+            <style>
+                body {{ 
+                    font-family: Arial, sans-serif; 
+                    padding: 20px; 
+                    max-width: 800px; 
+                    margin: 0 auto; 
+                    background-color: {colors["background"]};
+                    color: {colors["color"]};
+                    line-height: 1.6;
+                }}
+                pre {{ 
+                    background-color: {colors["code_background"]}; 
+                    padding: 10px; 
+                    border-radius: 5px; 
+                    {pre_style}
+                }}
+                code {{ font-family: 'Courier New', monospace; }}{extra_styles}
+            </style>
+            {mathjax_script(markdown_text, target, self_contained)}
+        </head>
+        <body>
+            {html_body}
+        </body>
+        </html>
+        """
+
+def get_export_settings():
+    """Export settings chosen under Advanced Export Settings, with defaults."""
+    return {
+        name: st.session_state.get(EXPORT_SETTING_WIDGETS[name], default)
+        for name, default in DEFAULT_EXPORT_SETTINGS.items()
+    }
+
+def render_export(export_name, markdown_text, settings, html_body=None, index=None):
+    """
+    Produce one export format from the converted Markdown.
+    Returns a dict with the file's data, filename and mime type; raises on failure.
+    """
+    if export_name == "HTML":
+        html_content = build_export_html(markdown_text, "html", settings["theme"], html_body,
+                                         self_contained=settings["html_self_contained"])
+        return {"data": html_content.encode(), "filename": "converted_markdown.html", "mime": "text/html"}
+    
+    if export_name == "Markdown":
+        return {"data": markdown_text.encode(), "filename": "converted_markdown.md", "mime": "text/markdown"}
+    
+    if export_name == "Plain Text":
+        return {"data": markdown_text.encode(), "filename": "converted_plaintext.txt", "mime": "text/plain"}
+    
+    if export_name == "LaTeX":
+        latex_content = export_to_latex(markdown_text, index)
+        return {"data": latex_content.encode(), "filename": "converted_latex.tex", "mime": "text/plain"}
+    
+    if export_name == "PDF":
+        options = {
+            "page-size": settings["page_size"],
+            "orientation": settings["orientation"],
+            "encoding": "UTF-8",
+        }
+        if mathjax_available() and wkhtmltopdf_version() >= (0, 12, 6):
+            # 0.12.6 stopped reading file:// URLs by default; the vendored MathJax is one
+            options["enable-local-file-access"] = None
+        html_content = build_export_html(markdown_text, "pdf", settings["theme"], html_body)
+        if settings["pdf_parallel"] and pdf_merge_available():
+            if html_body is None:
+                html_body = markdown_to_html(markdown_text)
+            shards = split_html_sections(html_body, min(PDF_SHARD_WORKERS, len(html_body) // PDF_SHARD_MIN_CHARS))
+            if len(shards) > 1:
+                pdf_bytes = render_pdf_shards(markdown_text, shards, settings["theme"], options)
+                return {"data": pdf_bytes, "filename": "converted_markdown.pdf", "mime": "application/pdf"}
+        pdf_bytes = pdfkit.from_string(html_content, False, options=options)
+        return {"data": pdf_bytes, "filename": "converted_markdown.pdf", "mime": "application/pdf"}
+    
+    with tempfile.TemporaryDirectory(prefix="export_") as export_dir:
+        if export_name == "Image":
+            html_content = build_export_html(markdown_text, "image", settings["theme"], html_body)
+            image_format = settings["image_format"]
+            page_width, page_height = PAGE_SIZES_PX[settings["page_size"]]
+            if settings["orientation"] == "Landscape":
+                page_width, page_height = page_height, page_width
+            
+            output_path = html_to_image(
+                html_content,
+                os.path.join(export_dir, f"converted_markdown.{IMAGE_FORMATS[image_format]['extension']}"),
+                image_format=image_format,
+                preset=settings["image_preset"],
+                paged=settings["image_layout"] == "Page sequence (ZIP)",
+                width=page_width,
+                tile_height=page_height,
+                background=EXPORT_THEMES[settings["theme"]]["background"],
+            )
+            mime = "application/zip" if output_path and output_path.endswith(".zip") else IMAGE_FORMATS[image_format]["mime"]
+        elif export_name == "Word":
+            output_path = export_to_docx(markdown_text, os.path.join(export_dir, "converted_markdown.docx"), index)
+            mime = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+        else:
+            raise ValueError(f"Unknown export format: {export_name}")
+        
+        if not output_path:
+            raise RuntimeError(f"{export_name} rendering failed")
+        with open(output_path, "rb") as f:
+            return {"data": f.read(), "filename": os.path.basename(output_path), "mime": mime}
+
+@functools.lru_cache(maxsize=None)
+def pdf_merge_available():
+    """Whether pypdf, needed to merge parallel PDF shards, is installed."""
+    try:
+        import pypdf
+    except ImportError:
+        return False
+    return True
+
+def split_html_sections(html_body, shards):
+    """
+    Split rendered HTML before top-level h1/h2 headings into at most `shards` contiguous
+    pieces of similar size. Returns [html_body] when there is nowhere to split.
+    """
+    if shards < 2:
+        return [html_body]
+    cuts = []
+    depth = 0
+    for match in _HTML_SECTION_TOKEN.finditer(html_body):
+        if match.group(1) is not None:
+            depth = max(0, depth - 1) if match.group(1) else depth + 1
+        elif depth == 0 and match.start() > 0:
+            cuts.append(match.start())
+    
+    pieces = []
+    start = 0
+    for cut in cuts:
+        if len(pieces) == shards - 1:
+            break
+        if cut - start >= len(html_body) / shards:
+            pieces.append(html_body[start:cut])
+            start = cut
+    pieces.append(html_body[start:])
+    return pieces
+
+def render_pdf_shards(markdown_text, shards, theme, options):
+    """
+    Render HTML shards with one wkhtmltopdf process each, then merge them in order,
+    keeping each shard's outline and numbering the pages 1..N across the whole document.
+    Each shard starts on a new page.
+    """
+    from pypdf import PdfReader, PdfWriter
+    
+    def render(shard):
+        return pdfkit.from_string(build_export_html(markdown_text, "pdf", theme, shard), False, options=options)
+    
+    with ThreadPoolExecutor(max_workers=len(shards)) as pool:
+        shard_pdfs = list(pool.map(render, shards))
+    
+    writer = PdfWriter()
+    for pdf_bytes in shard_pdfs:
+        writer.append(PdfReader(BytesIO(pdf_bytes)), import_outline=True)
+    writer.set_page_label(0, len(writer.pages) - 1, style="/D", start=1)
+    metadata = PdfReader(BytesIO(shard_pdfs[0])).metadata
+    if metadata:
+        writer.add_metadata(metadata)
+    
+    buffer = BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+def export_cache_key(export_name, markdown_text, settings):
+    """
+    Hash of the content, format and the export settings that format depends on; for
+    formats that typeset equations, also of where MathJax is loaded from.
+    """
+    relevant = {name: settings[name] for name in EXPORT_CACHE_SETTINGS[export_name]}
+    if export_name in MATHJAX_EXPORTS:
+        relevant["mathjax"] = [MATHJAX_URL, MATHJAX_VERSION if mathjax_available() else None]
+    digest = hashlib.sha256(markdown_text.encode())
+    digest.update(f"\0{export_name}\0{json.dumps(relevant, sort_keys=True)}".encode())
+    return digest.hexdigest()
+
+def export_cache_get(key):
+    """Return a cached artifact and mark it recently used, or None."""
+    data_path = os.path.join(EXPORT_CACHE_DIR, f"{key}.bin")
+    meta_path = os.path.join(EXPORT_CACHE_DIR, f"{key}.json")
+    try:
+        with open(meta_path, encoding="utf-8") as f:
+            artifact = json.load(f)
+        with open(data_path, "rb") as f:
+            artifact["data"] = f.read()
+        os.utime(meta_path)
+        return artifact
+    except (OSError, ValueError):
+        return None
+
+def export_cache_put(key, artifact):
+    """Store an artifact, then evict least recently used entries over the size limits."""
+    os.makedirs(EXPORT_CACHE_DIR, exist_ok=True)
+    data_path = os.path.join(EXPORT_CACHE_DIR, f"{key}.bin")
+    meta_path = os.path.join(EXPORT_CACHE_DIR, f"{key}.json")
+    
+    # Write data before metadata so a readable entry is always complete
+    tmp_suffix = f".{os.getpid()}.{uuid.uuid4().hex}.tmp"
+    with open(data_path + tmp_suffix, "wb") as f:
+        f.write(artifact["data"])
+    os.replace(data_path + tmp_suffix, data_path)
+    with open(meta_path + tmp_suffix, "w", encoding="utf-8") as f:
+        json.dump({"filename": artifact["filename"], "mime": artifact["mime"]}, f)
+    os.replace(meta_path + tmp_suffix, meta_path)
+    
+    evict_export_cache()
+
+def evict_export_cache():
+    """Drop least recently used artifacts until the cache is within its byte and entry limits."""
+    entries = []
+    total = 0
+    for name in os.listdir(EXPORT_CACHE_DIR):
+        if not name.endswith(".json"):
+            continue
+        key = name[:-5]
+        try:
+            last_used = os.path.getmtime(os.path.join(EXPORT_CACHE_DIR, name))
+            size = os.path.getsize(os.path.join(EXPORT_CACHE_DIR, f"{key}.bin"))
+        except OSError:
+            continue
+        entries.append((last_used, key, size))
+        total += size
+    
+    entries.sort()
+    while entries and (total > EXPORT_CACHE_MAX_BYTES or len(entries) > EXPORT_CACHE_MAX_ENTRIES):
+        _, key, size = entries.pop(0)
+        for suffix in (".json", ".bin"):
+            try:
+                os.remove(os.path.join(EXPORT_CACHE_DIR, key + suffix))
+            except OSError:
+                pass
+        total -= size
+
+class SharedCache(ABC):
+    """
+    Key-value cache shared between app processes, with per-entry TTLs and a lease per key
+    so that concurrent workers missing the same key compute it only once.
+    Backend errors are treated as misses; the cache never fails a request.
+    """
+    
+    # Whether entries live on this host only (other tiers here already cover that)
+    local = True
+    
+    @abstractmethod
+    def get(self, key):
+        """Value stored for key, or None when missing or expired."""
+    
+    @abstractmethod
+    def put(self, key, value, ttl=None):
+        """Store value for key for ttl seconds, or the backend's default TTL."""
+    
+    @abstractmethod
+    def acquire(self, key):
+        """Take the lease for key; return a token, or None if another worker holds it."""
+    
+    @abstractmethod
+    def release(self, key, token):
+        """Give up the lease for key if token still holds it."""
+    
+    def safe_get(self, key):
+        try:
+            return self.get(key)
+        except Exception:
+            return None
+    
+    def safe_put(self, key, value, ttl=None):
+        try:
+            self.put(key, value, ttl)
+        except Exception:
+            pass
+    
+    @contextmanager
+    def lock(self, key, wait=SHARED_CACHE_WAIT_SECONDS):
+        """Hold the lease for key, waiting for another holder to finish (or give up after wait)."""
+        token = None
+        deadline = time.time() + wait
+        delay = 0.05
+        while True:
+            try:
+                token = self.acquire(key)
+            except Exception:
+                break  # Backend unavailable: go ahead unlocked
+            if token is not None or time.time() >= deadline:
+                break
+            time.sleep(delay)
+            delay = min(delay * 2, 1.0)
+        try:
+            yield
+        finally:
+            if token is not None:
+                try:
+                    self.release(key, token)
+                except Exception:
+                    pass
+    
+    def get_or_compute(self, key, compute, ttl=None):
+        """Return the bytes cached under key, or compute() them once across all workers and cache them."""
+        value = self.safe_get(key)
+        if value is not None:
+            return value
+        with self.lock(key):
+            # Another worker may have finished it while we waited for the lease
+            value = self.safe_get(key)
+            if value is None:
+                value = compute()
+                self.safe_put(key, value, ttl)
+        return value
+
+class SQLiteCache(SharedCache):
+    """SharedCache in a SQLite database (WAL mode), shared by every process on this host."""
+    
+    def __init__(self, path, max_bytes=SHARED_CACHE_MAX_BYTES, ttl=SHARED_CACHE_TTL):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.connections = threading.local()
+        with self._connect() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value BLOB, size INTEGER, expires REAL, accessed REAL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+            db.execute("CREATE TABLE IF NOT EXISTS leases (key TEXT PRIMARY KEY, token TEXT, expires REAL)")
+    
+    def _connect(self):
+        # sqlite3 connections can't be shared between threads, so keep one per thread
+        db = getattr(self.connections, "db", None)
+        if db is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            db = sqlite3.connect(self.path, timeout=10)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self.connections.db = db
+        return db
+    
+    def get(self, key):
+        db = self._connect()
+        now = time.time()
+        row = db.execute("SELECT value FROM entries WHERE key = ? AND expires > ?", (key, now)).fetchone()
+        if row is None:
+            return None
+        # Refresh recency at most once a minute to keep reads mostly write-free
+        with db:
+            db.execute("UPDATE entries SET accessed = ? WHERE key = ? AND accessed < ?", (now, key, now - 60))
+        return row[0]
+    
+    def put(self, key, value, ttl=None):
+        if len(value) > self.max_bytes // 4:
+            return  # Too big to be worth displacing everything else
+        db = self._connect()
+        now = time.time()
+        with db:
+            db.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, expires, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now + (ttl or self.ttl), now),
+            )
+            # Expired entries go first, then least recently used ones until under the size limit
+            db.execute("DELETE FROM entries WHERE expires <= ?", (now,))
+            total = db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total > self.max_bytes:
+                doomed = []
+                for old_key, size in db.execute("SELECT key, size FROM entries ORDER BY accessed"):
+                    if total <= self.max_bytes:
+                        break
+                    doomed.append((old_key,))
+                    total -= size
+                db.executemany("DELETE FROM entries WHERE key = ?", doomed)
+    
+    def acquire(self, key):
+        db = self._connect()
+        token = uuid.uuid4().hex
+        now = time.time()
+        with db:
+            db.execute("DELETE FROM leases WHERE key = ? AND expires <= ?", (key, now))
+            taken = db.execute(
+                "INSERT OR IGNORE INTO leases (key, token, expires) VALUES (?, ?, ?)",
+                (key, token, now + SHARED_CACHE_LEASE_SECONDS),
+            ).rowcount
+        return token if taken else None
+    
+    def release(self, key, token):
+        db = self._connect()
+        with db:
+            db.execute("DELETE FROM leases WHERE key = ? AND token = ?", (key, token))
+    
+    def stats(self):
+        entries, size = self._connect().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return {"backend": "SQLite", "entries": entries, "bytes": size}
+
+class RedisCache(SharedCache):
+    """SharedCache on a Redis server, shared across hosts. Size is bounded by the server's maxmemory policy."""
+    
+    local = False
+    # Delete the lease only if we still own it
+    RELEASE_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+    
+    def __init__(self, url, max_bytes=SHARED_CACHE_MAX_BYTES, ttl=SHARED_CACHE_TTL):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+    
+    def get(self, key):
+        return self.client.get(f"latex_converter:{key}")
+    
+    def put(self, key, value, ttl=None):
+        if len(value) <= self.max_bytes // 4:
+            self.client.set(f"latex_converter:{key}", value, ex=ttl or self.ttl)
+    
+    def acquire(self, key):
+        token = uuid.uuid4().hex
+        if self.client.set(f"latex_converter:lease:{key}", token, nx=True, ex=SHARED_CACHE_LEASE_SECONDS):
+            return token
+        return None
+    
+    def release(self, key, token):
+        self.client.eval(self.RELEASE_SCRIPT, 1, f"latex_converter:lease:{key}", token)
+    
+    def stats(self):
+        return {"backend": "Redis", "entries": self.client.dbsize(), "bytes": self.client.info("memory")["used_memory"]}
+
+@st.cache_resource
+def get_shared_cache():
+    """The process-wide SharedCache: Redis when configured and importable, otherwise SQLite."""
+    if SHARED_CACHE_REDIS_URL:
+        try:
+            return RedisCache(SHARED_CACHE_REDIS_URL)
+        except ImportError:
+            logger.warning("LATEX_CONVERTER_REDIS_URL is set but the redis package is not installed; using SQLite")
+    return SQLiteCache(SHARED_CACHE_PATH)
+
+def shared_cached_text(namespace, text, compute):
+    """compute() for text, through the shared cache when text is big enough to be worth a round trip."""
+    if len(text) < SHARED_CACHE_MIN_CHARS:
+        return compute()
+    key = f"{namespace}:{hashlib.sha256(text.encode('utf-8')).hexdigest()}"
+    return get_shared_cache().get_or_compute(key, lambda: compute().encode("utf-8")).decode("utf-8")
+
+def cached_convert_latex(text):
+    """
+    convert_latex_to_markdown with its diagnostics, shared between app processes for
+    large documents. Returns (markdown, diagnostics).
+    """
+    def convert():
+        diagnostics = []
+        markdown_text = convert_latex_to_markdown(text, diagnostics)
+        return json.dumps({"markdown": markdown_text, "diagnostics": diagnostics})
+    result = json.loads(shared_cached_text("conversion", text, convert))
+    return result["markdown"], result["diagnostics"]
+
+def get_input_diagnostics():
+    """Diagnostics of the current editor input, or [] until it has been converted."""
+    if st.session_state.get("diagnostics_input") != st.session_state.get("user_input"):
+        return []
+    return st.session_state.get("diagnostics", [])
+
+def _pack_artifact(artifact):
+    header = json.dumps({"filename": artifact["filename"], "mime": artifact["mime"]}).encode("utf-8")
+    return header + b"\n" + artifact["data"]
+
+def _unpack_artifact(value):
+    header, data = value.split(b"\n", 1)
+    artifact = json.loads(header)
+    artifact["data"] = data
+    return artifact
+
+def get_export_artifact(export_name, markdown_text, settings, html_body=None, index=None):
+    """
+    Return an export artifact, from the disk cache when this exact export was made before.
+    Concurrent requests for the same export, in any app process, render it only once;
+    with a Redis shared cache, artifacts rendered on other hosts are reused too.
+    """
+    if export_name not in EXPORT_CACHE_SETTINGS:
+        artifact = render_export(export_name, markdown_text, settings, html_body, index)
+        artifact["cached"] = False
+        return artifact
+    
+    key = export_cache_key(export_name, markdown_text, settings)
+    shared = get_shared_cache()
+    
+    def lookup():
+        artifact = export_cache_get(key)
+        if artifact is None and not shared.local:
+            value = shared.safe_get(f"export:{key}")
+            if value is not None:
+                artifact = _unpack_artifact(value)
+                try:
+                    export_cache_put(key, artifact)
+                except OSError:
+                    pass
+        return artifact
+    
+    artifact = lookup()
+    if artifact is None:
+        with shared.lock(f"export:{key}"):
+            artifact = lookup()  # Rendered by another worker while we waited
+            if artifact is None:
+                artifact = render_export(export_name, markdown_text, settings, html_body, index)
+                try:
+                    export_cache_put(key, artifact)
+                except OSError:
+                    pass  # A full or read-only cache directory shouldn't fail the export
+                if not shared.local:
+                    shared.safe_put(f"export:{key}", _pack_artifact(artifact))
+                artifact["cached"] = False
+                return artifact
+    artifact["cached"] = True
+    return artifact
+
+def export_all_formats(markdown_text, settings, index=None, on_progress=None, formats=EXPORT_ALL_FORMATS):
+    """
+    Render every export format in parallel and write each into one ZIP as it finishes.
+    All HTML-based formats share a single markdown_to_html result, so the total time
+    is that of the slowest format. Returns (zip bytes, {format: error message}).
+    """
+    html_body = markdown_to_html(markdown_text)
+    if index is None:
+        index = EquationIndex(markdown_text)
+    
+    buffer = BytesIO()
+    errors = {}
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive, \
+            ThreadPoolExecutor(max_workers=len(formats)) as pool:
+        futures = {
+            pool.submit(get_export_artifact, export_name, markdown_text, settings, html_body, index): export_name
+            for export_name in formats
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            export_name = futures[future]
+            try:
+                artifact = future.result()
+                archive.writestr(artifact["filename"], artifact["data"])
+            except Exception as e:
+                errors[export_name] = str(e)
+            if on_progress:
+                on_progress(done, len(futures), export_name)
+        
+        if errors:
+            archive.writestr("export_errors.txt", "\n".join(f"{name}: {error}" for name, error in errors.items()))
+    return buffer.getvalue(), errors
+
+class Prerenderer:
+    """
+    Renders likely exports ahead of the click, one at a time on a niced background thread.
+    Work is queued per session so an edit can cancel what hasn't started yet, and a CPU
+    budget plus a load-average check keep it from competing with foreground conversions.
+    """
+    
+    def __init__(self):
+        self.pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prerender", initializer=self._lower_priority)
+        self.lock = threading.Lock()
+        self.futures = {}  # session id -> futures of its latest submission
+        self.budget = PRERENDER_CPU_BURST
+        self.refilled = time.monotonic()
+        self.stats = Counter()
+    
+    @staticmethod
+    def _lower_priority():
+        # Linux nice values are per thread, and renderer subprocesses inherit them
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+        except (AttributeError, OSError):
+            pass
+    
+    def _take_budget(self):
+        now = time.monotonic()
+        with self.lock:
+            self.budget = min(PRERENDER_CPU_BURST, self.budget + (now - self.refilled) * PRERENDER_CPU_SHARE)
+            self.refilled = now
+            return self.budget > 0
+    
+    def _charge(self, cpu_seconds, renderer_seconds):
+        with self.lock:
+            self.budget -= cpu_seconds + renderer_seconds
+            self.stats["cpu_seconds"] += cpu_seconds
+            self.stats["renderer_seconds"] += renderer_seconds
+    
+    def submit(self, session_id, export_names, markdown_text, settings, index):
+        """Queue exports for one session's output, replacing whatever it had queued before."""
+        self.cancel(session_id)
+        futures = [
+            self.pool.submit(self._render, export_name, markdown_text, settings, index)
+            for export_name in export_names
+        ]
+        with self.lock:
+            # Sessions whose exports have all finished have nothing left to cancel
+            for finished in [sid for sid, queued in self.futures.items() if all(f.done() for f in queued)]:
+                del self.futures[finished]
+            self.futures[session_id] = futures
+            self.stats["submitted"] += len(futures)
+    
+    def cancel(self, session_id):
+        """Drop a session's queued exports; one already rendering runs to completion."""
+        with self.lock:
+            futures = self.futures.pop(session_id, [])
+        cancelled = sum(1 for future in futures if future.cancel())
+        with self.lock:
+            self.stats["cancelled"] += cancelled
+    
+    def _render(self, export_name, markdown_text, settings, index):
+        key = export_cache_key(export_name, markdown_text, settings)
+        if os.path.exists(os.path.join(EXPORT_CACHE_DIR, f"{key}.json")):
+            outcome = "already_cached"
+        elif not self._take_budget():
+            outcome = "over_budget"
+        elif system_load() > PRERENDER_MAX_LOAD:
+            outcome = "busy"
+        else:
+            # This thread's own CPU time, plus the wall-clock time it spent off the CPU, which
+            # is mostly waiting for the wkhtmltopdf or browser subprocess. That subprocess's
+            # CPU time can't be read per thread, and RUSAGE_CHILDREN mixes in foreground exports.
+            cpu_started = time.thread_time()
+            started = time.monotonic()
+            try:
+                get_export_artifact(export_name, markdown_text, settings, index=index)
+                outcome = "rendered"
+            except Exception:
+                outcome = "failed"
+            cpu_seconds = time.thread_time() - cpu_started
+            self._charge(cpu_seconds, max(0.0, time.monotonic() - started - cpu_seconds))
+        with self.lock:
+            self.stats[outcome] += 1
+        return outcome
+
+@st.cache_resource
+def get_prerenderer():
+    """The process-wide Prerenderer shared by all sessions."""
+    return Prerenderer()
+
+@st.cache_resource
+def get_export_click_stats():
+    """Export clicks per format across all sessions of this worker."""
+    return Counter()
+
+def system_load():
+    """1-minute load average per core, or 0.0 where the OS doesn't report one."""
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    except (AttributeError, OSError):
+        return 0.0
+
+def record_export_click(export_name):
+    """Count an export click for this session and for the whole worker."""
+    clicks = st.session_state.setdefault("export_clicks", {})
+    clicks[export_name] = clicks.get(export_name, 0) + 1
+    get_export_click_stats()[export_name] += 1
+
+def prerender_candidates(excluded=()):
+    """Cached formats ranked by this session's clicks, then everyone's; unclicked formats are left out."""
+    session_clicks = st.session_state.get("export_clicks", {})
+    global_clicks = get_export_click_stats()
+    ranked = sorted(
+        (name for name in EXPORT_CACHE_SETTINGS
+         if name not in excluded and (session_clicks.get(name) or global_clicks[name])),
+        key=lambda name: (session_clicks.get(name, 0), global_clicks[name]),
+        reverse=True,
+    )
+    return ranked[:PRERENDER_TOP_FORMATS]
+
+def cancel_prerender():
+    """Cancel this session's queued speculative exports (the output is about to change)."""
+    st.session_state.prerender_output = None
+    get_prerenderer().cancel(st.session_state.session_id)
+
+def prerender_timer():
+    """Queue speculative exports once the output has been stable for PRERENDER_STABLE_SECONDS."""
+    output = st.session_state.get("raw_output")
+    if not output or st.session_state.get("prerender_output") == output:
+        return
+    if time.time() - st.session_state.get("output_stable_since", time.time()) < PRERENDER_STABLE_SECONDS:
+        return
+    export_names = prerender_candidates(st.session_state.get("prerender_excluded", ()))
+    st.session_state.prerender_output = output
+    if export_names:
+        get_prerenderer().submit(
+            st.session_state.session_id,
+            export_names,
+            output,
+            get_export_settings(),
+            get_equation_index(output),
+        )
+
 def get_download_link(file_path, link_text, file_type):
     """Generate a download link for a file."""
     try:
@@ -135,71 +1574,870 @@ def load_from_local_storage():
     """
     return js_code
 
+def _line_delta(old, new):
+    """
+    Line-level delta that rebuilds new from old: (start, end) ranges of old's lines to
+    copy, and lists of new lines in between.
+    """
+    old_lines = old.splitlines(keepends=True)
+    new_lines = new.splitlines(keepends=True)
+    
+    # Trim the common head and tail first; edits are usually local
+    limit = min(len(old_lines), len(new_lines))
+    head = 0
+    while head < limit and old_lines[head] == new_lines[head]:
+        head += 1
+    tail = 0
+    while tail < limit - head and old_lines[-1 - tail] == new_lines[-1 - tail]:
+        tail += 1
+    
+    delta = [(0, head)] if head else []
+    matcher = difflib.SequenceMatcher(
+        None, old_lines[head:len(old_lines) - tail], new_lines[head:len(new_lines) - tail]
+    )
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            delta.append((head + i1, head + i2))
+        elif j2 > j1:
+            delta.append(new_lines[head + j1:head + j2])
+    if tail:
+        delta.append((len(old_lines) - tail, len(old_lines)))
+    return delta
+
+def _apply_line_delta(old, delta):
+    old_lines = old.splitlines(keepends=True)
+    parts = []
+    for op in delta:
+        if isinstance(op, tuple):
+            parts.extend(old_lines[op[0]:op[1]])
+        else:
+            parts.extend(op)
+    return "".join(parts)
+
+def _delta_size(delta):
+    return sum(len(line) for op in delta if isinstance(op, list) for line in op)
+
+def iter_history(history):
+    """Yield (entry, input, output) for each history entry, replaying deltas from the full copies."""
+    input_text = output_text = ""
+    for entry in history:
+        if "input" in entry:
+            input_text, output_text = entry["input"], entry["output"]
+        else:
+            input_text = _apply_line_delta(input_text, entry["input_delta"])
+            output_text = _apply_line_delta(output_text, entry["output_delta"])
+        yield entry, input_text, output_text
+
+def _history_head():
+    """(input, output) of the newest history snapshot, or None."""
+    if not st.session_state.history:
+        return None
+    if "history_head" not in st.session_state:
+        for _, input_text, output_text in iter_history(st.session_state.history):
+            pass
+        st.session_state.history_head = (input_text, output_text)
+    return st.session_state.history_head
+
+def remove_history_entry(index):
+    """Remove one history entry, turning the entry after it into a full copy if it was a delta on it."""
+    history = st.session_state.history
+    if index + 1 < len(history) and "input" not in history[index + 1]:
+        for entry, input_text, output_text in iter_history(history[:index + 2]):
+            pass
+        history[index + 1] = {
+            "timestamp": entry["timestamp"],
+            "input_preview": entry["input_preview"],
+            "input": input_text,
+            "output": output_text,
+        }
+    history.pop(index)
+    st.session_state.pop("history_head", None)
+
 def add_to_history(input_text, output_text):
-    """Add current conversion to history"""
+    """Add current conversion to history, as a line delta against the previous snapshot when that is smaller."""
     if len(input_text) > 0 and len(output_text) > 0:
+        st.session_state.history_snapshot_requested = False
+        
+        # Add to history if it's different from the last entry
+        head = _history_head()
+        if head is not None and head[0] == input_text:
+            return
+        
         timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         
         # Truncate long entries for display
         input_preview = input_text[:100] + "..." if len(input_text) > 100 else input_text
         
-        entry = {
-            "timestamp": timestamp,
-            "input": input_text,
-            "input_preview": input_preview,
-            "output": output_text
-        }
+        entry = {"timestamp": timestamp, "input_preview": input_preview}
+        history = st.session_state.history
+        deltas_since_base = 0
+        for previous in reversed(history):
+            if "input" in previous:
+                break
+            deltas_since_base += 1
         
-        # Add to history if it's different from the last entry
-        if not st.session_state.history or st.session_state.history[-1]["input"] != input_text:
-            st.session_state.history.append(entry)
+        if head is not None and deltas_since_base + 1 < HISTORY_REBASE_INTERVAL:
+            entry["input_delta"] = _line_delta(head[0], input_text)
+            entry["output_delta"] = _line_delta(head[1], output_text)
+            # A rewrite is cheaper to keep whole than to replay
+            if _delta_size(entry["input_delta"]) + _delta_size(entry["output_delta"]) > (len(input_text) + len(output_text)) // 2:
+                del entry["input_delta"], entry["output_delta"]
+        if "input_delta" not in entry:
+            entry["input"] = input_text
+            entry["output"] = output_text
+        
+        history.append(entry)
+        
+        # Keep history at maximum HISTORY_MAX_ENTRIES items
+        while len(history) > HISTORY_MAX_ENTRIES:
+            remove_history_entry(0)
+        st.session_state.history_head = (input_text, output_text)
+
+def snapshot_history():
+    """Take a history snapshot of the current input right away (explicit actions)."""
+    if st.session_state.get("user_input") and st.session_state.get("converted_input") == st.session_state.user_input:
+        add_to_history(st.session_state.user_input, st.session_state.raw_output)
+
+def history_snapshot_due(now=None):
+    """Whether to snapshot: editing has been idle for HISTORY_IDLE_SECONDS, or an action asked for it."""
+    if st.session_state.get("history_snapshot_requested"):
+        return True
+    last_edit = st.session_state.get("last_edit_time")
+    return last_edit is None or (now or time.time()) - last_edit >= HISTORY_IDLE_SECONDS
+
+def history_unsaved():
+    """Whether the converted input differs from the newest history snapshot."""
+    head = _history_head()
+    return bool(st.session_state.get("user_input")) and (head is None or head[0] != st.session_state.user_input)
+
+def history_timer():
+    """Rerun the app once typing has been idle long enough to snapshot history."""
+    if history_unsaved() and history_snapshot_due():
+        st.rerun()
+
+def _jsonl_byte_ranges(mm, size, range_size=JSONL_RANGE_SIZE):
+    """Split a memory-mapped JSONL file into byte ranges that end on record boundaries."""
+    ranges = []
+    start = 0
+    while start < size:
+        end = min(start + range_size, size)
+        if end < size:
+            newline = mm.find(b"\n", end - 1)
+            end = size if newline == -1 else newline + 1
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+def _convert_json_field(obj, path):
+    """Convert the string(s) at a dotted field path in place. `*` walks every list item."""
+    if not path:
+        return False
+    key, rest = path[0], path[1:]
+    if key == "*":
+        children = range(len(obj)) if isinstance(obj, list) else []
+    elif isinstance(obj, dict):
+        children = [key] if key in obj else []
+    elif isinstance(obj, list) and key.isdigit() and int(key) < len(obj):
+        children = [int(key)]
+    else:
+        children = []
+    
+    changed = False
+    for child in children:
+        value = obj[child]
+        if rest:
+            changed = _convert_json_field(value, rest) or changed
+        elif isinstance(value, str):
+            converted = convert_latex_to_markdown(value)
+            if converted != value:
+                obj[child] = converted
+                changed = True
+    return changed
+
+def _convert_jsonl_range(job):
+    """Convert one byte range of a JSONL file into a part file (runs in a worker process)."""
+    input_path, start, end, field, part_path = job
+    path = field.split(".")
+    stats = {"records": 0, "converted": 0, "errors": 0}
+    
+    with open(input_path, "rb") as f, open(part_path, "wb") as out:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if hasattr(mm, "madvise"):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            released = start - start % mmap.PAGESIZE
+            pos = start
+            while pos < end:
+                newline = mm.find(b"\n", pos, end)
+                line_end = end if newline == -1 else newline + 1
+                line = mm[pos:line_end]
+                pos = line_end
+                
+                if line.strip():
+                    stats["records"] += 1
+                    try:
+                        record = json.loads(line)
+                        if _convert_json_field(record, path):
+                            line = json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n"
+                            stats["converted"] += 1
+                    except (ValueError, TypeError):
+                        # Keep malformed records byte-for-byte so the output stays aligned
+                        stats["errors"] += 1
+                out.write(line)
+                
+                # Drop pages we are done with so resident memory stays flat
+                if hasattr(mm, "madvise") and pos - released >= JSONL_RELEASE_INTERVAL:
+                    upto = pos - pos % mmap.PAGESIZE
+                    mm.madvise(mmap.MADV_DONTNEED, released, upto - released)
+                    released = upto
+        finally:
+            mm.close()
+    return stats
+
+def convert_jsonl_file(input_path, output_path, field="content", workers=None, range_size=JSONL_RANGE_SIZE):
+    """
+    Convert a JSON field in every record of a (possibly huge) JSONL file.
+    The input is memory-mapped and split into record-aligned byte ranges that
+    are converted in parallel; results are written to output_path in input order.
+    """
+    size = os.path.getsize(input_path)
+    stats = {"records": 0, "converted": 0, "errors": 0, "bytes": size}
+    
+    with open(input_path, "rb") as f:
+        if size == 0:
+            ranges = []
+        else:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                ranges = _jsonl_byte_ranges(mm, size, range_size)
+    
+    output_dir = os.path.dirname(os.path.abspath(output_path))
+    with tempfile.TemporaryDirectory(dir=output_dir, prefix=".jsonl_parts_") as parts_dir:
+        jobs = [
+            (input_path, start, end, field, os.path.join(parts_dir, f"{i:06d}.part"))
+            for i, (start, end) in enumerate(ranges)
+        ]
+        with open(output_path, "wb") as out, ProcessPoolExecutor(max_workers=workers) as pool:
+            # map() yields in submission order, so parts are appended in input order
+            for job, part_stats in zip(jobs, pool.map(_convert_jsonl_range, jobs)):
+                with open(job[4], "rb") as part:
+                    shutil.copyfileobj(part, out, 1024 * 1024)
+                os.remove(job[4])
+                for key in ("records", "converted", "errors"):
+                    stats[key] += part_stats[key]
+    return stats
+
+def iter_json_array(fp, chunk_size=JSON_STREAM_CHUNK):
+    """
+    Yield the elements of a top-level JSON array one at a time.
+    Only the element being decoded is held in memory, so arrays far larger
+    than RAM (e.g. a ChatGPT conversations.json) can be walked as a stream.
+    """
+    buf = ""
+    eof = False
+    
+    def read_more():
+        nonlocal buf, eof
+        chunk = fp.read(chunk_size)
+        if not chunk:
+            eof = True
+        buf += chunk
+    
+    # Find the opening bracket
+    pos = 0
+    while True:
+        stripped = buf.lstrip()
+        if stripped:
+            if stripped[0] != "[":
+                raise ValueError("Expected a JSON array")
+            buf = stripped[1:]
+            break
+        if eof:
+            raise ValueError("Expected a JSON array")
+        read_more()
+    
+    while True:
+        # Skip separators up to the next element or the closing bracket
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos < len(buf) or eof:
+                break
+            buf, pos = buf[pos:], 0
+            read_more()
+        if pos >= len(buf):
+            raise ValueError("Unterminated JSON array")
+        if buf[pos] == "]":
+            return
+        
+        # Scan to the end of the element, skipping over whole strings
+        start = i = pos
+        depth = 0
+        end = None
+        while end is None:
+            m = _JSON_TOKEN.search(buf, i)
+            # A lone quote means the string continues past the buffered text
+            if m and m.group() != '"':
+                c = m.group()
+                i = m.end()
+                if c in "[{":
+                    depth += 1
+                elif c in "]}":
+                    depth -= 1
+                    if depth == 0:
+                        end = i
+                    elif depth < 0:
+                        end = m.start()
+                elif c == "," and depth == 0:
+                    end = m.start()
+                continue
             
-            # Keep history at maximum 20 items
-            if len(st.session_state.history) > 20:
-                st.session_state.history.pop(0)
+            # Ran out of buffered text mid-element
+            if eof:
+                raise ValueError("Unterminated JSON array")
+            i = m.start() if m else len(buf)
+            buf, i, start = buf[start:], i - start, 0
+            read_more()
+        
+        yield json.loads(buf[start:end])
+        buf, pos = buf[end:], 0
+
+def chatgpt_conversation_messages(conversation):
+    """Return the (role, text) pairs on the active branch of a ChatGPT conversation tree."""
+    mapping = conversation.get("mapping") or {}
+    node_id = conversation.get("current_node")
+    if node_id not in mapping:
+        # No recorded position: start at the root and follow the newest child
+        node_id = next((key for key, node in mapping.items() if not node.get("parent")), None)
+        while node_id in mapping and mapping[node_id].get("children"):
+            node_id = mapping[node_id]["children"][-1]
+    
+    branch = []
+    while node_id in mapping:
+        branch.append(mapping[node_id])
+        node_id = mapping[node_id].get("parent")
+    
+    messages = []
+    for node in reversed(branch):
+        message = node.get("message") or {}
+        role = (message.get("author") or {}).get("role")
+        metadata = message.get("metadata") or {}
+        if role not in ("user", "assistant") or metadata.get("is_visually_hidden_from_conversation"):
+            continue
+        
+        content = message.get("content") or {}
+        if content.get("content_type") == "code":
+            text = f"```\n{content.get('text', '')}\n```"
+        else:
+            text = "\n\n".join(part for part in content.get("parts") or [] if isinstance(part, str))
+        if text.strip():
+            messages.append((role, text))
+    return messages
+
+def chatgpt_conversation_to_markdown(conversation):
+    """Render one ChatGPT conversation as Markdown, converting LaTeX in assistant replies."""
+    title = conversation.get("title") or "Untitled conversation"
+    lines = [f"# {title}", ""]
+    if conversation.get("create_time"):
+        created = datetime.datetime.fromtimestamp(conversation["create_time"])
+        lines += [f"*{created.strftime('%Y-%m-%d %H:%M:%S')}*", ""]
+    
+    for role, text in chatgpt_conversation_messages(conversation):
+        if role == "assistant":
+            lines += ["## Assistant", "", convert_latex_to_markdown(text), ""]
+        else:
+            lines += ["## User", "", text, ""]
+    return "\n".join(lines)
+
+def _open_chatgpt_export(export_path):
+    """
+    Open conversations.json as a text stream, reading it straight out of an export ZIP if needed.
+    Returns the stream and its size in bytes.
+    """
+    if zipfile.is_zipfile(export_path):
+        archive = zipfile.ZipFile(export_path)
+        info = next((i for i in archive.infolist() if os.path.basename(i.filename) == "conversations.json"), None)
+        if info is None:
+            archive.close()
+            raise ValueError("conversations.json not found in export archive")
+        return io.TextIOWrapper(archive.open(info), encoding="utf-8"), info.file_size
+    return open(export_path, encoding="utf-8"), os.path.getsize(export_path)
 
-def export_to_latex(markdown_text):
+def import_chatgpt_export(export_path, output_path, archive=False, since=None, until=None, title_filter=None,
+                          on_progress=None):
+    """
+    Stream a ChatGPT data export and write each conversation as Markdown.
+    Writes one .md file per conversation into the output_path directory, or into a
+    single ZIP archive at output_path when archive is True. since/until are dates and
+    title_filter is a case-insensitive substring. on_progress(fraction) is called after
+    each conversation with the share of the export read so far.
+    """
+    stats = {"conversations": 0, "written": 0, "skipped": 0}
+    title_filter = title_filter.lower() if title_filter else None
+    used_names = set()
+    
+    if archive:
+        sink = zipfile.ZipFile(output_path, "w", compression=zipfile.ZIP_DEFLATED)
+    else:
+        os.makedirs(output_path, exist_ok=True)
+        sink = None
+    
+    try:
+        fp, size = _open_chatgpt_export(export_path)
+        with fp:
+            for conversation in iter_json_array(fp):
+                stats["conversations"] += 1
+                if on_progress is not None and size:
+                    on_progress(min(1.0, fp.buffer.tell() / size))
+                title = conversation.get("title") or "Untitled conversation"
+                created = datetime.datetime.fromtimestamp(conversation.get("create_time") or 0)
+                
+                if (since and created.date() < since) or (until and created.date() > until) \
+                        or (title_filter and title_filter not in title.lower()):
+                    stats["skipped"] += 1
+                    continue
+                
+                # Unique, filesystem-safe name per conversation
+                slug = re.sub(r'[^\w\-]+', '-', title).strip('-')[:60] or "untitled"
+                name = f"{created.strftime('%Y-%m-%d')}_{slug}"
+                if name in used_names:
+                    name = f"{name}_{str(conversation.get('id') or stats['conversations'])[:8]}"
+                used_names.add(name)
+                
+                content = chatgpt_conversation_to_markdown(conversation)
+                if sink is not None:
+                    sink.writestr(f"{name}.md", content)
+                else:
+                    with open(os.path.join(output_path, f"{name}.md"), "w", encoding="utf-8") as f:
+                        f.write(content)
+                stats["written"] += 1
+    finally:
+        if sink is not None:
+            sink.close()
+    return stats
+
+def convert_text_file(src, output_path, total_bytes=None, on_progress=None, page_chars=UPLOAD_PAGE_CHARS):
+    """
+    Stream-convert a binary file object of UTF-8 text into output_path, one chunk at a time.
+    on_progress(fraction) is called after each chunk when total_bytes is known. Returns the
+    output size and the byte offset of each page of about page_chars characters, broken
+    after a line where possible.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    
+    def chunks():
+        done = 0
+        while True:
+            data = src.read(UPLOAD_CHUNK_BYTES)
+            if not data:
+                break
+            done += len(data)
+            yield decoder.decode(data)
+            if on_progress is not None and total_bytes:
+                on_progress(min(1.0, done / total_bytes))
+        yield decoder.decode(b"", final=True)
+    
+    pages = [0]
+    page_fill = 0  # Characters already on the current page
+    with open(output_path, "wb") as out:
+        for text in convert_latex_stream(chunks()):
+            pos = 0
+            while True:
+                target = pos + max(0, page_chars - page_fill)
+                if target >= len(text):
+                    break
+                newline = text.find("\n", target, target + page_chars)
+                if newline != -1:
+                    cut = newline + 1
+                elif target + page_chars <= len(text):
+                    cut = target  # A page-long line: break it mid-line
+                else:
+                    break  # The line may end in the next piece
+                out.write(text[pos:cut].encode("utf-8"))
+                pages.append(out.tell())
+                page_fill = 0
+                pos = cut
+            out.write(text[pos:].encode("utf-8"))
+            page_fill += len(text) - pos
+        size = out.tell()
+    
+    if len(pages) > 1 and pages[-1] == size:
+        pages.pop()
+    return {"bytes": size, "pages": pages}
+
+def purge_stale_uploads():
+    """Delete converted uploads left behind by sessions that have gone away."""
+    cutoff = time.time() - SESSION_REGISTRY_TTL
+    try:
+        entries = list(os.scandir(UPLOAD_DIR))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        try:
+            if entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except OSError:
+            pass
+
+def discard_upload_result(result):
+    """Delete the file behind a converted upload."""
+    if result:
+        try:
+            os.remove(result["path"])
+        except OSError:
+            pass
+
+def convert_uploaded_file(uploaded, on_progress=None):
+    """
+    Convert an uploaded file to a file on the server, never holding the result in memory.
+    Text files are stream-converted to Markdown; a .json ChatGPT export becomes a ZIP with
+    one Markdown file per conversation. Returns the result's path, download name, MIME type
+    and either its page offsets or its ZIP members.
+    """
+    purge_stale_uploads()
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    stem, ext = os.path.splitext(uploaded.name)
+    is_export = ext.lower() == ".json"
+    fd, output_path = tempfile.mkstemp(suffix=".zip" if is_export else ".md", dir=UPLOAD_DIR)
+    os.close(fd)
+    uploaded.seek(0)
+    
+    try:
+        if not is_export:
+            stats = convert_text_file(uploaded, output_path, uploaded.size, on_progress)
+            return {
+                "path": output_path,
+                "filename": f"{stem}_converted.md",
+                "mime": "text/markdown",
+                "bytes": stats["bytes"],
+                "pages": stats["pages"],
+                "members": None,
+            }
+        
+        # The importer streams from a path, so spool the upload to disk first
+        fd, source_path = tempfile.mkstemp(suffix=".json", dir=UPLOAD_DIR)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                shutil.copyfileobj(uploaded, f, UPLOAD_CHUNK_BYTES)
+            import_chatgpt_export(source_path, output_path, archive=True, on_progress=on_progress)
+        finally:
+            os.remove(source_path)
+        with zipfile.ZipFile(output_path) as archive:
+            members = archive.namelist()
+        return {
+            "path": output_path,
+            "filename": f"{stem}_markdown.zip",
+            "mime": "application/zip",
+            "bytes": os.path.getsize(output_path),
+            "pages": None,
+            "members": members,
+        }
+    except Exception:
+        os.remove(output_path)
+        raise
+
+def read_upload_page(result, page):
+    """Text of one page of a converted upload (one conversation for a ChatGPT export)."""
+    if result["members"] is not None:
+        with zipfile.ZipFile(result["path"]) as archive:
+            return archive.read(result["members"][page]).decode("utf-8")
+    pages = result["pages"]
+    end = pages[page + 1] if page + 1 < len(pages) else result["bytes"]
+    with open(result["path"], "rb") as f:
+        f.seek(pages[page])
+        return f.read(end - pages[page]).decode("utf-8", errors="replace")
+
+class EquationIndex:
+    """
+    Every equation span in a Markdown document, in document order. Display spans
+    are found first and inline spans only in the gaps between them, as the old
+    display-then-inline substitutions did, but in one pass over the text.
+    Offsets and kinds live in compact arrays; equation text is interned so
+    repeated equations are stored once and can be deduplicated by id.
+    """
+    __slots__ = ("starts", "ends", "kinds", "text_ids", "texts", "_ids")
+    
+    def __init__(self, markdown_text):
+        self.starts = array("L")
+        self.ends = array("L")
+        self.kinds = array("B")
+        self.text_ids = array("L")
+        self.texts = []
+        self._ids = {}
+        
+        position = 0
+        for match in _DISPLAY_EQUATION.finditer(markdown_text):
+            self._add_inline(markdown_text[position:match.start()], position)
+            self._add(match.start(), match.end(), EQ_DISPLAY, match.group(1))
+            position = match.end()
+        self._add_inline(markdown_text[position:], position)
+        self._ids = None
+    
+    def _add_inline(self, gap, offset):
+        # The gap is scanned on its own so the $ of a neighbouring display span
+        # doesn't count for the inline lookarounds
+        for match in _INLINE_EQUATION.finditer(gap):
+            self._add(offset + match.start(), offset + match.end(), EQ_INLINE, match.group(1))
+    
+    def _add(self, start, end, kind, equation):
+        text_id = self._ids.get(equation)
+        if text_id is None:
+            text_id = self._ids[equation] = len(self.texts)
+            self.texts.append(sys.intern(equation))
+        self.starts.append(start)
+        self.ends.append(end)
+        self.kinds.append(kind)
+        self.text_ids.append(text_id)
+    
+    def __len__(self):
+        return len(self.starts)
+    
+    def __iter__(self):
+        """Yield (start, end, kind, equation) for each span in document order."""
+        for start, end, kind, text_id in zip(self.starts, self.ends, self.kinds, self.text_ids):
+            yield start, end, kind, self.texts[text_id]
+    
+    def counts(self):
+        """Occurrences of each unique equation, keyed by text id."""
+        return Counter(self.text_ids)
+    
+    def occurrences(self, text_id):
+        """(start, end) offsets of every occurrence of one unique equation."""
+        return [
+            (start, end)
+            for start, end, other in zip(self.starts, self.ends, self.text_ids)
+            if other == text_id
+        ]
+
+def get_equation_index(markdown_text):
+    """Return the equation index for the current document, building it at most once per change."""
+    cached = st.session_state.get("equation_index")
+    if cached is not None and cached[0] == markdown_text:
+        return cached[1]
+    
+    index = EquationIndex(markdown_text)
+    st.session_state.equation_index = (markdown_text, index)
+    return index
+
+def split_markdown_blocks(markdown_text, index=None):
+    """
+    Return (start, end) offsets of the top-level blocks of a Markdown document.
+    Blocks are separated by blank lines, except inside fenced code and display equations.
+    """
+    if index is None:
+        index = EquationIndex(markdown_text)
+    display_spans = [
+        (start, end) for start, end, kind in zip(index.starts, index.ends, index.kinds)
+        if kind == EQ_DISPLAY
+    ]
+    
+    blocks = []
+    block_start = None
+    fence = None
+    span_pos = 0
+    for line in _LINE.finditer(markdown_text):
+        start = line.start()
+        stripped = line.group().strip()
+        
+        while span_pos < len(display_spans) and display_spans[span_pos][1] <= start:
+            span_pos += 1
+        in_equation = span_pos < len(display_spans) and display_spans[span_pos][0] < start
+        
+        if fence:
+            if stripped.startswith(fence):
+                fence = None
+        elif stripped.startswith(("```", "~~~")) and not in_equation:
+            fence = stripped[:3]
+        
+        if not stripped and fence is None and not in_equation:
+            if block_start is not None:
+                blocks.append((block_start, start))
+                block_start = None
+        elif block_start is None:
+            block_start = start
+    
+    if block_start is not None:
+        blocks.append((block_start, len(markdown_text)))
+    return blocks
+
+def get_markdown_blocks(markdown_text):
+    """Return the block offsets for the current document, splitting it at most once per change."""
+    cached = st.session_state.get("markdown_blocks")
+    if cached is not None and cached[0] == markdown_text:
+        return cached[1]
+    
+    blocks = split_markdown_blocks(markdown_text, get_equation_index(markdown_text))
+    st.session_state.markdown_blocks = (markdown_text, blocks)
+    return blocks
+
+def is_large_document(markdown_text, blocks):
+    """
+    Whether a document is big enough to need the windowed preview and editor. One
+    without blocks (only whitespace) has nothing to page through, whatever its size.
+    """
+    return bool(blocks) and (len(markdown_text) > LARGE_DOCUMENT_CHARS or len(blocks) > LARGE_DOCUMENT_BLOCKS)
+
+def load_watch_manifest(output_dir):
+    """Load the watch-mode manifest of source hashes, mtimes and outputs, or start a new one."""
+    try:
+        with open(os.path.join(output_dir, WATCH_MANIFEST_NAME), encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("version") == 1:
+            return manifest
+    except (OSError, ValueError):
+        pass
+    return {"version": 1, "files": {}}
+
+def save_watch_manifest(output_dir, manifest):
+    """Atomically write the watch-mode manifest."""
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, WATCH_MANIFEST_NAME)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+def _remove_watch_outputs(output_dir, entry):
+    for rel_output in entry.get("outputs", []):
+        try:
+            os.remove(os.path.join(output_dir, rel_output))
+        except OSError:
+            pass
+
+def sync_watched_file(source_dir, output_dir, rel_path, manifest, formats=(), settings=None):
+    """
+    Bring the outputs of one source file up to date with it.
+    Unchanged size and mtime skip the file without reading it; otherwise its content
+    hash decides whether it is really re-converted and re-exported.
+    Returns "converted", "unchanged" or "removed".
+    """
+    files = manifest["files"]
+    entry = files.get(rel_path)
+    source_path = os.path.join(source_dir, rel_path)
+    
+    try:
+        stat = os.stat(source_path)
+    except FileNotFoundError:
+        if entry:
+            _remove_watch_outputs(output_dir, entry)
+            del files[rel_path]
+        return "removed"
+    
+    outputs_present = entry is not None and all(
+        os.path.exists(os.path.join(output_dir, rel_output)) for rel_output in entry.get("outputs", [])
+    )
+    if outputs_present and entry["mtime_ns"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+        return "unchanged"
+    
+    with open(source_path, "rb") as f:
+        content = f.read()
+    digest = hashlib.sha256(content).hexdigest()
+    if outputs_present and entry["sha256"] == digest and entry.get("formats") == list(formats):
+        # Touched but not modified
+        entry.update(mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+        return "unchanged"
+    
+    markdown_text, _ = cached_convert_latex(content.decode("utf-8", errors="replace"))
+    stem = os.path.splitext(rel_path)[0]
+    target_dir = os.path.dirname(os.path.join(output_dir, rel_path))
+    os.makedirs(target_dir, exist_ok=True)
+    
+    outputs = [stem + ".md"]
+    with open(os.path.join(output_dir, outputs[0]), "w", encoding="utf-8") as f:
+        f.write(markdown_text)
+    
+    index = EquationIndex(markdown_text)
+    for export_name in formats:
+        artifact = get_export_artifact(export_name, markdown_text, settings or DEFAULT_EXPORT_SETTINGS, index=index)
+        rel_output = stem + os.path.splitext(artifact["filename"])[1]
+        if rel_output in outputs:
+            rel_output = f"{stem}.{export_name.lower().replace(' ', '_')}{os.path.splitext(artifact['filename'])[1]}"
+        with open(os.path.join(output_dir, rel_output), "wb") as f:
+            f.write(artifact["data"])
+        outputs.append(rel_output)
+    
+    # Outputs the previous version produced but this one didn't
+    if entry:
+        _remove_watch_outputs(output_dir, {"outputs": [o for o in entry.get("outputs", []) if o not in outputs]})
+    files[rel_path] = {
+        "sha256": digest,
+        "mtime_ns": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "formats": list(formats),
+        "outputs": outputs,
+    }
+    return "converted"
+
+def iter_watch_sources(source_dir, output_dir):
+    """Relative paths of every convertible file under source_dir, skipping the output folder."""
+    output_dir = os.path.abspath(output_dir)
+    for root, dirs, names in os.walk(source_dir):
+        dirs[:] = [d for d in dirs if os.path.abspath(os.path.join(root, d)) != output_dir and not d.startswith(".")]
+        for name in names:
+            if name.endswith(WATCH_EXTENSIONS) and not name.startswith("."):
+                yield os.path.relpath(os.path.join(root, name), source_dir)
+
+def reconcile_watch_folder(source_dir, output_dir, manifest, formats=(), settings=None, on_file=None):
+    """
+    Compare the whole source tree against the manifest and sync only what changed,
+    including outputs of files deleted since the last run. Returns counts per outcome.
+    """
+    stats = Counter()
+    seen = set()
+    for rel_path in iter_watch_sources(source_dir, output_dir):
+        seen.add(rel_path)
+        try:
+            outcome = sync_watched_file(source_dir, output_dir, rel_path, manifest, formats, settings)
+        except Exception as e:
+            outcome = "failed"
+            if on_file:
+                on_file(rel_path, f"failed: {e}")
+        else:
+            if on_file and outcome != "unchanged":
+                on_file(rel_path, outcome)
+        stats[outcome] += 1
+    
+    for rel_path in [path for path in manifest["files"] if path not in seen]:
+        stats[sync_watched_file(source_dir, output_dir, rel_path, manifest, formats, settings)] += 1
+        if on_file:
+            on_file(rel_path, "removed")
+    return stats
+
+def export_to_latex(markdown_text, index=None):
     """Convert markdown equations back to LaTeX format"""
-    # Convert display equations: $$ ... $$ to \[ ... \]
-    text = re.sub(r'\$\$(.*?)\$\$', r'\\[\1\\]', markdown_text, flags=re.DOTALL)
+    if index is None:
+        index = EquationIndex(markdown_text)
     
-    # Convert inline equations: $ ... $ to \( ... \)
-    text = re.sub(r'(?<!\$)\$(?!\$)(.*?)(?<!\$)\$(?!\$)', r'\\(\1\\)', text, flags=re.DOTALL)
+    # Rebuild the text with $$ ... $$ as \[ ... \] and $ ... $ as \( ... \)
+    pieces = []
+    last = 0
+    for start, end, kind, equation in index:
+        pieces.append(markdown_text[last:start])
+        pieces.append(f"\\[{equation}\\]" if kind == EQ_DISPLAY else f"\\({equation}\\)")
+        last = end
+    pieces.append(markdown_text[last:])
     
-    return text
+    return "".join(pieces)
 
-def export_to_docx(markdown_text, output_path="output.docx"):
+def export_to_docx(markdown_text, output_path="output.docx", index=None):
     """Export markdown to Word document"""
     try:
+        if index is None:
+            index = EquationIndex(markdown_text)
+        
         # Create a new document
         doc = docx.Document()
         
         # Add heading
         doc.add_heading('Converted Document', 0)
         
-        # Extract equations for special handling
-        equations = {}
-        eq_count = 0
-        
-        # Replace display equations with placeholders
-        def replace_display_eq(match):
-            nonlocal eq_count
-            eq_id = f"DISPLAY_EQ_{eq_count}"
-            eq_count += 1
-            equations[eq_id] = match.group(1)
-            return eq_id
-        
-        # Replace inline equations with placeholders
-        def replace_inline_eq(match):
-            nonlocal eq_count
-            eq_id = f"INLINE_EQ_{eq_count}"
-            eq_count += 1
-            equations[eq_id] = match.group(1)
-            return eq_id
-        
-        # Replace equations with placeholders
-        text_with_placeholders = re.sub(r'\$\$(.*?)\$\$', replace_display_eq, markdown_text, flags=re.DOTALL)
-        text_with_placeholders = re.sub(r'(?<!\$)\$(?!\$)(.*?)(?<!\$)\$(?!\$)', replace_inline_eq, text_with_placeholders, flags=re.DOTALL)
+        # Replace equations with placeholders for special handling
+        pieces = []
+        last = 0
+        for eq_num, (start, end, kind, equation) in enumerate(index):
+            pieces.append(markdown_text[last:start])
+            pieces.append(f"{'DISPLAY' if kind == EQ_DISPLAY else 'INLINE'}_EQ_{eq_num}")
+            last = end
+        pieces.append(markdown_text[last:])
+        text_with_placeholders = "".join(pieces)
         
         # Split by paragraphs and add to document
         paragraphs = text_with_placeholders.split('\n\n')
@@ -208,8 +2446,12 @@ def export_to_docx(markdown_text, output_path="output.docx"):
                 p = doc.add_paragraph()
                 # Check for equation placeholders
                 for word in para.split():
-                    if word.startswith("DISPLAY_EQ_") or word.startswith("INLINE_EQ_"):
-                        p.add_run(f"[EQUATION: {equations[word]}]").italic = True
+                    placeholder = _EQUATION_PLACEHOLDER.match(word)
+                    if placeholder and int(placeholder.group(2)) < len(index):
+                        equation = index.texts[index.text_ids[int(placeholder.group(2))]]
+                        p.add_run(f"[EQUATION: {equation}]").italic = True
+                        if word[placeholder.end():]:
+                            p.add_run(word[placeholder.end():] + " ")
                     else:
                         p.add_run(word + " ")
         
@@ -220,6 +2462,160 @@ def export_to_docx(markdown_text, output_path="output.docx"):
         st.error(f"Error exporting to Word: {e}")
         return None
 
+def estimate_size(obj, seen=None):
+    """Approximate bytes held by an object and everything it references, counting shared objects once."""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (str, bytes, bytearray, array)):
+        return size
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += estimate_size(key, seen) + estimate_size(value, seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for item in obj:
+            size += estimate_size(item, seen)
+    elif hasattr(obj, "__slots__"):
+        for slot in obj.__slots__:
+            size += estimate_size(getattr(obj, slot, None), seen)
+    elif hasattr(obj, "__dict__"):
+        size += estimate_size(vars(obj), seen)
+    return size
+
+def session_memory_usage():
+    """Bytes held by each session_state key of the current session."""
+    seen = set()
+    return {key: estimate_size(st.session_state[key], seen) for key in list(st.session_state.keys())}
+
+@st.cache_resource
+def get_session_registry():
+    """Process-wide record of memory use per session, shared by all sessions of this worker."""
+    return {}
+
+@st.cache_resource
+def get_session_registry_lock():
+    """Guards the session registry, which every session's script thread updates."""
+    return threading.Lock()
+
+def session_registry_snapshot():
+    """A copy of the session registry that is safe to iterate."""
+    with get_session_registry_lock():
+        return dict(get_session_registry())
+
+def editor_key():
+    """Widget key of the input editor for the current editor generation."""
+    return f"{EDITOR_KEY_PREFIX}{st.session_state.get('editor_generation', 0)}"
+
+def reset_editor():
+    """Draw a fresh editor holding user_input on the next run, dropping the old widget's value."""
+    st.session_state.editor_generation = st.session_state.get("editor_generation", 0) + 1
+
+def capped_bytes(usage):
+    """Session bytes that count toward SESSION_MAX_BYTES (everything but editor widget state)."""
+    return sum(size for key, size in usage.items() if not key.startswith(EDITOR_KEY_PREFIX))
+
+def enforce_session_memory_cap():
+    """
+    Keep the current session under SESSION_MAX_BYTES and record its usage.
+    Oldest history entries are evicted first, then rebuildable cached data.
+    """
+    usage = session_memory_usage()
+    total = sum(usage.values())
+    evicted = 0
+    
+    while capped_bytes(usage) > SESSION_MAX_BYTES and st.session_state.history:
+        remove_history_entry(0)
+        evicted += 1
+        usage = session_memory_usage()
+        total = sum(usage.values())
+    
+    for key in SESSION_CACHE_KEYS:
+        if capped_bytes(usage) <= SESSION_MAX_BYTES:
+            break
+        if key in st.session_state:
+            del st.session_state[key]
+            evicted += 1
+            usage = session_memory_usage()
+            total = sum(usage.values())
+    
+    # Publish this session's usage and forget sessions that have gone away
+    registry = get_session_registry()
+    now = time.time()
+    with get_session_registry_lock():
+        registry[st.session_state.session_id] = {
+            "bytes": total,
+            "largest_key": max(usage, key=usage.get) if usage else "",
+            "history_entries": len(st.session_state.history),
+            "evictions": registry.get(st.session_state.session_id, {}).get("evictions", 0) + evicted,
+            "last_seen": now,
+        }
+        expired = [sid for sid, info in registry.items() if now - info["last_seen"] > SESSION_REGISTRY_TTL]
+        for session_id in expired:
+            registry.pop(session_id, None)
+    for session_id in expired:
+        get_prerenderer().cancel(session_id)
+    return total
+
+def get_process_rss():
+    """Resident memory of this worker process in bytes (Linux), or None if unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+def get_debounce_seconds():
+    """
+    Pause required before converting editor changes. Stretches to the cost of the
+    last conversion so slow documents do work per pause rather than per keystroke,
+    but never beyond the latency budget.
+    """
+    debounce = st.session_state.get("debounce_ms", DEBOUNCE_MS) / 1000
+    budget = st.session_state.get("latency_budget_ms", LATENCY_BUDGET_MS) / 1000
+    return min(max(debounce, st.session_state.get("last_conversion_seconds", 0.0)), budget)
+
+def conversion_due(now=None):
+    """Whether pending editor changes should be converted on this run."""
+    pending_since = st.session_state.get("pending_since")
+    if pending_since is None:
+        return True  # Not an editor burst: example, paste or history load
+    now = now or time.time()
+    budget = st.session_state.get("latency_budget_ms", LATENCY_BUDGET_MS) / 1000
+    return (now - st.session_state.last_edit_time >= get_debounce_seconds()
+            or now - pending_since >= budget)
+
+def convert_input_if_due():
+    """
+    Convert the editor input once the editor settles (or right away for other changes).
+    Returns whether a conversion is still pending.
+    """
+    if not st.session_state.user_input:
+        st.session_state.pending_since = None
+        return False
+    # Only reconvert when the input changed, so edits to the raw output survive reruns
+    if st.session_state.get("converted_input") == st.session_state.user_input:
+        st.session_state.pending_since = None
+        return False
+    if not conversion_due():
+        return True
+    started = time.perf_counter()
+    st.session_state.raw_output, st.session_state.diagnostics = cached_convert_latex(st.session_state.user_input)
+    st.session_state.diagnostics_input = st.session_state.converted_input = st.session_state.user_input
+    st.session_state.last_conversion_seconds = time.perf_counter() - started
+    st.session_state.pending_since = None
+    if (time.time() - st.session_state.last_autosave) > 5:  # Autosave every 5 seconds
+        save_to_local_storage()
+    return False
+
+def conversion_timer():
+    """Rerun the app once the user has paused typing, so the pending conversion happens."""
+    if st.session_state.get("pending_since") is not None and conversion_due():
+        st.rerun()
+
 def get_theme_styles():
     """Return CSS styles based on current theme"""
     light_theme = """
@@ -599,7 +2995,7 @@ def main():
     """
     st.markdown(tabs_css, unsafe_allow_html=True)
     
-    tab1, tab2 = st.tabs(["✏️ Converter", "📋 History"])
+    tab1, tab2, tab3, tab4 = st.tabs(["✏️ Converter", "📋 History", "🧮 Equations", "📁 Large File"])
     
     with tab1:
         # Example input section with improved styling
@@ -621,7 +3017,10 @@ Another display equation:
 """
             st.code(example_text, language="markdown")
             if st.button("Use This Example", key="use_example"):
+                snapshot_history()
                 st.session_state.user_input = example_text
+                st.session_state.pending_since = None
+                st.session_state.history_snapshot_requested = True
                 st.rerun()
         
         # User input section
@@ -646,7 +3045,10 @@ Another display equation:
                 try:
                     import pyperclip
                     clipboard_text = pyperclip.paste()
+                    snapshot_history()
                     st.session_state.user_input = clipboard_text
+                    st.session_state.pending_since = None
+                    st.session_state.history_snapshot_requested = True
                     st.rerun()
                 except ImportError:
                     st.error("Pyperclip not installed. Please install with: pip install pyperclip")
@@ -668,37 +3070,137 @@ Another display equation:
         st.markdown('<div class="tooltip">Hover for tips <span class="tooltiptext">Paste LaTeX from ChatGPT with \\( \\) or \\[ \\] delimiters</span></div>', unsafe_allow_html=True)
         
         editor_theme = "github" if st.session_state.theme == "light" else "monokai"
+        # Convert before drawing the editor, so the run the debounce timer triggers (or an
+        # example, paste or history load) shows its annotations without another rerun
+        convert_input_if_due()
+        input_diagnostics = get_input_diagnostics()
         current_ace_value = st_ace(
             value=st.session_state.user_input,
             language="latex",
             theme=editor_theme,
-            key="input_area",
+            key=editor_key(),
             height=250,
             font_size=14,
             wrap=True,
             auto_update=True,
             show_gutter=True,
+            annotations=diagnostics_to_annotations(st.session_state.user_input, input_diagnostics[:MAX_DIAGNOSTICS_SHOWN]),
         )
         
+        rejected_chars = st.session_state.pop("rejected_input_chars", None)
+        if rejected_chars:
+            st.error(
+                f"Input is {rejected_chars:,} characters; the limit is {MAX_INPUT_CHARS:,}. "
+                "The previous input has been kept."
+            )
+        
         # Check if the value has changed
-        if current_ace_value != st.session_state.user_input:
+        if current_ace_value is not None and len(current_ace_value) > MAX_INPUT_CHARS:
+            # Swap in a fresh editor so the oversized text doesn't stay in its widget state
+            st.session_state.rejected_input_chars = len(current_ace_value)
+            reset_editor()
+            st.rerun()
+        elif current_ace_value != st.session_state.user_input:
+            # Editor change: record it and let the debounce decide when to convert
             st.session_state.user_input = current_ace_value
-            if (time.time() - st.session_state.last_autosave) > 5:  # Autosave every 5 seconds
-                save_to_local_storage()
+            st.session_state.last_edit_time = time.time()
+            cancel_prerender()
+            if st.session_state.get("pending_since") is None:
+                st.session_state.pending_since = st.session_state.last_edit_time
+        
+        with st.expander("⚡ Live Conversion Settings", expanded=False):
+            col1, col2 = st.columns(2)
+            with col1:
+                st.number_input("Pause before converting (ms)", min_value=0, max_value=10000, step=100,
+                                value=DEBOUNCE_MS, key="debounce_ms",
+                                help="Editor changes are converted once you stop typing for this long")
+            with col2:
+                st.number_input("Latency budget (ms)", min_value=100, max_value=30000, step=100,
+                                value=LATENCY_BUDGET_MS, key="latency_budget_ms",
+                                help="Longest the preview may lag behind while you keep typing")
         
         st.markdown('</div>', unsafe_allow_html=True)
         
-        # Convert LaTeX to Markdown in real-time
+        # Edits converted right away (no pause configured) show their annotations on the next run
+        conversion_pending = convert_input_if_due()
+        
+        if conversion_pending:
+            # Keystrokes arriving meanwhile supersede this run; the timer fires once they stop
+            st.caption("⏳ Preview updates when you pause typing...")
+            st.fragment(conversion_timer, run_every=max(0.1, get_debounce_seconds() / 2))()
+        
+        # Problems found in the equations by the conversion scan
+        input_diagnostics = get_input_diagnostics()
+        input_errors = sum(1 for diagnostic in input_diagnostics if diagnostic["type"] == "error")
+        if input_diagnostics:
+            input_warnings = len(input_diagnostics) - input_errors
+            st.warning(
+                f"⚠️ {input_errors} error(s) and {input_warnings} warning(s) in the equations. "
+                "Hover over the markers in the editor gutter for details."
+            )
+            with st.expander("Equation problems", expanded=False):
+                for annotation in diagnostics_to_annotations(st.session_state.user_input, input_diagnostics[:MAX_DIAGNOSTICS_SHOWN]):
+                    st.markdown(f"- **Line {annotation['row'] + 1}, column {annotation['column'] + 1}** ({annotation['type']}): "
+                                f"`{annotation['text']}`")
+                if len(input_diagnostics) > MAX_DIAGNOSTICS_SHOWN:
+                    st.caption(f"...and {len(input_diagnostics) - MAX_DIAGNOSTICS_SHOWN} more")
+        
         if st.session_state.user_input:
-            converted_text = convert_latex_to_markdown(st.session_state.user_input)
-            st.session_state.raw_output = converted_text
+            converted_text = st.session_state.raw_output
+            
+            # Snapshot history once editing goes idle, not on every converted keystroke
+            if not conversion_pending:
+                if history_snapshot_due():
+                    add_to_history(st.session_state.user_input, converted_text)
+                elif history_unsaved():
+                    st.fragment(history_timer, run_every=HISTORY_IDLE_SECONDS / 2)()
             
-            # Add to history
-            add_to_history(st.session_state.user_input, converted_text)
+            # Pre-render likely exports once the output stops changing
+            if st.session_state.get("stable_output") != converted_text:
+                st.session_state.stable_output = converted_text
+                st.session_state.output_stable_since = time.time()
+                cancel_prerender()
+            if PRERENDER_ENABLED and not conversion_pending and st.session_state.get("prerender_output") != converted_text:
+                st.fragment(prerender_timer, run_every=PRERENDER_STABLE_SECONDS / 2)()
             
             # Live Preview Section 
             st.markdown('<div class="section-title">Live Preview</div>', unsafe_allow_html=True)
             
+            blocks = get_markdown_blocks(st.session_state.raw_output)
+            large_document = is_large_document(st.session_state.raw_output, blocks)
+            
+            # Large documents only send a window of blocks to the browser
+            if large_document:
+                if 'preview_window' not in st.session_state:
+                    st.session_state.preview_window = (0, PREVIEW_WINDOW_BLOCKS)
+                window_start, window_end = st.session_state.preview_window
+                window_start = min(window_start, max(0, len(blocks) - 1))
+                window_end = max(window_start + 1, min(window_end, len(blocks)))
+                st.session_state.preview_window = (window_start, window_end)
+                
+                st.info(
+                    f"Large document: {len(blocks)} blocks, {len(st.session_state.raw_output):,} characters. "
+                    f"Showing blocks {window_start + 1}–{window_end}."
+                )
+                nav_col1, nav_col2, nav_col3 = st.columns([1, 1, 2])
+                with nav_col1:
+                    if st.button("⬆️ Previous", key="preview_prev", disabled=window_start == 0):
+                        new_start = max(0, window_start - PREVIEW_WINDOW_BLOCKS)
+                        st.session_state.preview_window = (new_start, new_start + PREVIEW_WINDOW_BLOCKS)
+                        st.rerun()
+                with nav_col2:
+                    if st.button("⬇️ Load more", key="preview_more", disabled=window_end >= len(blocks)):
+                        new_end = min(len(blocks), window_end + PREVIEW_WINDOW_BLOCKS)
+                        # Keep the rendered window bounded by dropping blocks from the top
+                        new_start = max(window_start, new_end - PREVIEW_MAX_BLOCKS)
+                        st.session_state.preview_window = (new_start, new_end)
+                        st.rerun()
+                with nav_col3:
+                    jump_to = st.number_input("Jump to block", min_value=1, max_value=len(blocks), value=window_start + 1)
+                    if jump_to - 1 != window_start:
+                        st.session_state.preview_window = (jump_to - 1, jump_to - 1 + PREVIEW_WINDOW_BLOCKS)
+                        st.rerun()
+            
             # Show rendered and raw output side by side
             col1, col2 = st.columns(2)
             
@@ -706,7 +3208,15 @@ Another display equation:
             with col1:
                 st.markdown('<div class="card-container">', unsafe_allow_html=True)
                 st.markdown("### 🔍 Rendered Preview")
-                st.markdown(f'<div class="converted-text">{converted_text}</div>', unsafe_allow_html=True)
+                equation_index = get_equation_index(st.session_state.raw_output)
+                st.caption(f"{len(equation_index)} equations ({len(equation_index.texts)} unique) — see the Equations tab")
+                if large_document:
+                    # One element per block, so only the window is typeset
+                    with st.container(height=600):
+                        for block_start, block_end in blocks[window_start:window_end]:
+                            st.markdown(st.session_state.raw_output[block_start:block_end])
+                else:
+                    st.markdown(f'<div class="converted-text">{converted_text}</div>', unsafe_allow_html=True)
                 st.markdown('</div>', unsafe_allow_html=True)
                 
             # Raw output column with editable text area
@@ -721,6 +3231,13 @@ Another display equation:
                         save_to_local_storage()
                     st.rerun()
                 
+                # Splice an edited window back into the full document
+                def update_raw_window(start, end, key):
+                    raw = st.session_state.raw_output
+                    st.session_state.raw_output = raw[:start] + st.session_state[key] + raw[end:]
+                    if (time.time() - st.session_state.last_autosave) > 5:  # Autosave every 5 seconds
+                        save_to_local_storage()
+                
                 # Custom styling for text area
                 text_area_height = 300
                 text_area_bg_color = "#ffffff" if st.session_state.theme == "light" else "#2d2d2d"
@@ -739,13 +3256,28 @@ Another display equation:
                 </style>
                 """, unsafe_allow_html=True)
                 
-                editable_raw = st.text_area(
-                    "Edit converted markdown:",
-                    value=st.session_state.raw_output,
-                    key="editable_raw_output",
-                    on_change=update_raw_output,
-                    height=text_area_height
-                )
+                if large_document:
+                    # Only the windowed blocks are sent; edits are spliced back by offset
+                    raw_start = blocks[window_start][0]
+                    raw_end = blocks[window_end - 1][1]
+                    raw_window = st.session_state.raw_output[raw_start:raw_end]
+                    window_key = f"editable_raw_window_{raw_start}_{raw_end}_{len(st.session_state.raw_output)}"
+                    st.text_area(
+                        f"Edit converted markdown (blocks {window_start + 1}–{window_end}):",
+                        value=raw_window,
+                        key=window_key,
+                        on_change=update_raw_window,
+                        args=(raw_start, raw_end, window_key),
+                        height=text_area_height
+                    )
+                else:
+                    editable_raw = st.text_area(
+                        "Edit converted markdown:",
+                        value=st.session_state.raw_output,
+                        key="editable_raw_output",
+                        on_change=update_raw_output,
+                        height=text_area_height
+                    )
                 st.markdown('</div>', unsafe_allow_html=True)
             
             # Export options section with grid layout
@@ -753,16 +3285,35 @@ Another display equation:
             st.markdown('<div class="section-title">Export Options</div>', unsafe_allow_html=True)
             
             export_formats = [
-                {"name": "HTML", "icon": "🌐", "description": "Export as HTML with MathJax support"},
-                {"name": "Markdown", "icon": "📝", "description": "Export as Markdown text file"},
-                {"name": "PDF", "icon": "📄", "description": "Export as PDF document (requires wkhtmltopdf)"},
-                {"name": "JPG", "icon": "🖼️", "description": "Export as JPG image (requires html2image)"},
-                {"name": "LaTeX", "icon": "📐", "description": "Export back to LaTeX format"},
-                {"name": "Word", "icon": "📘", "description": "Export as Word document"},
-                {"name": "Plain Text", "icon": "📃", "description": "Export as plain text file"},
+                {"name": "HTML", "icon": "🌐", "description": "Export as HTML with MathJax support",
+                 "label": "HTML", "ready": "HTML file"},
+                {"name": "Markdown", "icon": "📝", "description": "Export as Markdown text file",
+                 "label": "Markdown", "ready": "Markdown file"},
+                {"name": "PDF", "icon": "📄", "description": "Export as PDF document (requires wkhtmltopdf)",
+                 "label": "PDF", "ready": "PDF file", "hint": "Make sure wkhtmltopdf is installed on your system."},
+                {"name": "Image", "icon": "🖼️", "description": "Export as PNG, WebP or JPEG image (requires html2image)",
+                 "label": "Image", "ready": "Image", "hint": "Make sure html2image is installed and a browser is available."},
+                {"name": "LaTeX", "icon": "📐", "description": "Export back to LaTeX format",
+                 "label": "LaTeX", "ready": "LaTeX file"},
+                {"name": "Word", "icon": "📘", "description": "Export as Word document",
+                 "label": "Word Document", "ready": "Word document", "hint": "Make sure python-docx is installed with: pip install python-docx"},
+                {"name": "Plain Text", "icon": "📃", "description": "Export as plain text file",
+                 "label": "Plain Text", "ready": "Plain text file"},
                 {"name": "Copy to Clipboard", "icon": "📋", "description": "Copy converted text to clipboard"}
             ]
             
+            # PDF and image rendering is slow, so don't spend it on input known to be broken
+            blocked_exports = ()
+            if input_errors:
+                export_anyway = st.checkbox(
+                    f"Export PDF and images despite {input_errors} equation error(s)",
+                    key="export_despite_errors",
+                    help="These equations will likely render incorrectly",
+                )
+                if not export_anyway:
+                    blocked_exports = VALIDATED_EXPORTS
+            st.session_state.prerender_excluded = blocked_exports
+            
             st.markdown('<div class="export-grid">', unsafe_allow_html=True)
             
             # Generate export buttons
@@ -772,205 +3323,9 @@ Another display equation:
                 export_desc = format_info["description"]
                 
                 if st.button(f"{export_icon} {export_name}", help=export_desc, key=f"export_{export_name.lower()}"):
-                    if export_name == "HTML":
-                        html_content = f"""
-                        <!DOCTYPE html>
-                        <html>
-                        <head>
-                            <title>Exported Markdown</title>
-                            <meta charset="UTF-8">
-                            <style>
-                                body {{ 
-                                    font-family: Arial, sans-serif; 
-                                    padding: 20px; 
-                                    max-width: 800px; 
-                                    margin: 0 auto; 
-                                    line-height: 1.6;
-                                }}
-                                pre {{ 
-                                    background-color: #f5f5f5; 
-                                    padding: 10px; 
-                                    border-radius: 5px; 
-                                    overflow-x: auto;
-                                }}
-                                code {{ font-family: 'Courier New', monospace; }}
-                                .math-container {{
-                                    padding: 10px 0;
-                                    overflow-x: auto;
-                                }}
-                            </style>
-                            <script src="https://cdnjs.cloudflare.com/ajax/libs/mathjax/2.7.7/MathJax.js?config=TeX-MML-AM_CHTML" async></script>
-                        </head>
-                        <body>
-                            {markdown_to_html(st.session_state.raw_output)}
-                        </body>
-                        </html>
-                        """
-                        
-                        b64 = base64.b64encode(html_content.encode()).decode()
-                        href = f'<a href="data:text/html;base64,{b64}" download="converted_markdown.html" class="export-button">Download HTML</a>'
-                        st.markdown(href, unsafe_allow_html=True)
-                        st.success("HTML file ready for download! Click the button above to save it.")
-
-                    elif export_name == "Markdown":
-                        b64 = base64.b64encode(st.session_state.raw_output.encode()).decode()
-                        href = f'<a href="data:text/markdown;base64,{b64}" download="converted_markdown.md" class="export-button">Download Markdown</a>'
-                        st.markdown(href, unsafe_allow_html=True)
-                        st.success("Markdown file ready for download! Click the button above to save it.")
-                    
-                    elif export_name == "PDF":
-                        with st.spinner("Generating PDF..."):
-                            try:
-                                html_content = f"""
-                                <!DOCTYPE html>
-                                <html>
-                                <head>
-                                    <title>Exported Markdown</title>
-                                    <meta charset="UTF-8">
-                                    <style>
-                                        body {{ 
-                                            font-family: Arial, sans-serif; 
-                                            padding: 20px; 
-                                            max-width: 800px; 
-                                            margin: 0 auto;
-                                            line-height: 1.6;
-                                        }}
-                                        pre {{ 
-                                            background-color: #f5f5f5; 
-                                            padding: 10px; 
-                                            border-radius: 5px;
-                                            white-space: pre-wrap;
-                                        }}
-                                        code {{ font-family: 'Courier New', monospace; }}
-                                    </style>
-                                    <script src="https://cdnjs.cloudflare.com/ajax/libs/mathjax/2.7.7/MathJax.js?config=TeX-MML-AM_CHTML" async></script>
-                                </head>
-                                <body>
-                                    {markdown_to_html(st.session_state.raw_output)}
-                                </body>
-                                </html>
-                                """
-                                
-                                pdf_path = "converted_markdown.pdf"
-                                pdfkit.from_string(html_content, pdf_path)
-                                
-                                with open(pdf_path, "rb") as pdf_file:
-                                    pdf_bytes = pdf_file.read()
-                                
-                                b64 = base64.b64encode(pdf_bytes).decode()
-                                href = f'<a href="data:application/pdf;base64,{b64}" download="converted_markdown.pdf" class="export-button">Download PDF</a>'
-                                st.markdown(href, unsafe_allow_html=True)
-                                st.success("PDF file ready for download! Click the button above to save it.")
-                                
-                                # Clean up
-                                if os.path.exists(pdf_path):
-                                    os.remove(pdf_path)
-                                    
-                            except Exception as e:
-                                st.error(f"Error exporting to PDF: {e}")
-                                st.info("Make sure wkhtmltopdf is installed on your system.")
-                    
-                    elif export_name == "JPG":
-                        with st.spinner("Generating JPG image..."):
-                            try:
-                                html_content = f"""
-                                <!DOCTYPE html>
-                                <html>
-                                <head>
-                                    <title>Exported Markdown</title>
-                                    <meta charset="UTF-8">
-                                    <style>
-                                        body {{ 
-                                            font-family: Arial, sans-serif; 
-                                            padding: 20px; 
-                                            max-width: 800px; 
-                                            margin: 0 auto;
-                                            background-color: white;
-                                            line-height: 1.6;
-                                        }}
-                                        pre {{ 
-                                            background-color: #f5f5f5; 
-                                            padding: 10px; 
-                                            border-radius: 5px;
-                                            white-space: pre-wrap;
-                                        }}
-                                        code {{ font-family: 'Courier New', monospace; }}
-                                    </style>
-                                    <script src="https://cdnjs.cloudflare.com/ajax/libs/mathjax/2.7.7/MathJax.js?config=TeX-MML-AM_CHTML" async></script>
-                                </head>
-                                <body>
-                                    {markdown_to_html(st.session_state.raw_output)}
-                                </body>
-                                </html>
-                                """
-                                
-                                # Save HTML to a temporary file
-                                temp_html = "temp_export.html"
-                                with open(temp_html, "w", encoding="utf-8") as f:
-                                    f.write(html_content)
-                                
-                                # Convert to image
-                                img_path = "converted_markdown.jpg"
-                                hti = Html2Image()
-                                hti.screenshot(url=os.path.abspath(temp_html), save_as=img_path)
-                                
-                                # Provide download link
-                                with open(img_path, "rb") as img_file:
-                                    img_bytes = img_file.read()
-                                
-                                b64 = base64.b64encode(img_bytes).decode()
-                                href = f'<a href="data:image/jpeg;base64,{b64}" download="converted_markdown.jpg" class="export-button">Download JPG</a>'
-                                st.markdown(href, unsafe_allow_html=True)
-                                st.success("JPG image ready for download! Click the button above to save it.")
-                                
-                                # Clean up
-                                if os.path.exists(temp_html):
-                                    os.remove(temp_html)
-                                if os.path.exists(img_path):
-                                    os.remove(img_path)
-                                    
-                            except Exception as e:
-                                st.error(f"Error exporting to JPG: {e}")
-                                st.info("Make sure html2image is installed and a browser is available.")
-                    
-                    elif export_name == "LaTeX":
-                        latex_content = export_to_latex(st.session_state.raw_output)
-                        b64 = base64.b64encode(latex_content.encode()).decode()
-                        href = f'<a href="data:text/plain;base64,{b64}" download="converted_latex.tex" class="export-button">Download LaTeX</a>'
-                        st.markdown(href, unsafe_allow_html=True)
-                        st.success("LaTeX file ready for download! Click the button above to save it.")
-                    
-                    elif export_name == "Word":
-                        with st.spinner("Generating Word document..."):
-                            try:
-                                docx_path = "converted_markdown.docx"
-                                export_to_docx(st.session_state.raw_output, docx_path)
-                                
-                                with open(docx_path, "rb") as docx_file:
-                                    docx_bytes = docx_file.read()
-                                
-                                b64 = base64.b64encode(docx_bytes).decode()
-                                href = f'<a href="data:application/vnd.openxmlformats-officedocument.wordprocessingml.document;base64,{b64}" download="converted_markdown.docx" class="export-button">Download Word Document</a>'
-                                st.markdown(href, unsafe_allow_html=True)
-                                st.success("Word document ready for download! Click the button above to save it.")
-                                
-                                # Clean up
-                                if os.path.exists(docx_path):
-                                    os.remove(docx_path)
-                                    
-                            except Exception as e:
-                                st.error(f"Error exporting to Word: {e}")
-                                st.info("Make sure python-docx is installed with: pip install python-docx")
-                    
-                    elif export_name == "Plain Text":
-                        # Remove markdown formatting for a plain text version
-                        plain_text = st.session_state.raw_output
-                        b64 = base64.b64encode(plain_text.encode()).decode()
-                        href = f'<a href="data:text/plain;base64,{b64}" download="converted_plaintext.txt" class="export-button">Download Plain Text</a>'
-                        st.markdown(href, unsafe_allow_html=True)
-                        st.success("Plain text file ready for download! Click the button above to save it.")
-                    
-                    elif export_name == "Copy to Clipboard":
+                    snapshot_history()
+                    record_export_click(export_name)
+                    if export_name == "Copy to Clipboard":
                         try:
                             import pyperclip
                             pyperclip.copy(st.session_state.raw_output)
@@ -979,9 +3334,58 @@ Another display equation:
                             st.error("Pyperclip not installed. Please install with: pip install pyperclip")
                         except Exception as e:
                             st.error(f"Error copying to clipboard: {e}")
+                        continue
+                    
+                    if export_name in blocked_exports:
+                        st.error(f"{export_name} export skipped: the equations have errors. Fix them or tick the box above to export anyway.")
+                        continue
+                    
+                    with st.spinner(f"Generating {format_info['ready'].lower()}..."):
+                        try:
+                            artifact = get_export_artifact(
+                                export_name,
+                                st.session_state.raw_output,
+                                get_export_settings(),
+                                index=get_equation_index(st.session_state.raw_output),
+                            )
+                            
+                            b64 = base64.b64encode(artifact["data"]).decode()
+                            href = f'<a href="data:{artifact["mime"]};base64,{b64}" download="{artifact["filename"]}" class="export-button">Download {format_info["label"]}</a>'
+                            st.markdown(href, unsafe_allow_html=True)
+                            from_cache = " (served from cache)" if artifact["cached"] else ""
+                            st.success(f"{format_info['ready']} ready for download! Click the button above to save it.{from_cache}")
+                        except Exception as e:
+                            st.error(f"Error exporting to {export_name}: {e}")
+                            if "hint" in format_info:
+                                st.info(format_info["hint"])
             
             st.markdown('</div>', unsafe_allow_html=True)  # Close export-grid
             
+            # Every format at once, bundled into a single ZIP
+            if st.button("📦 Export All Formats", help="Render all formats in parallel and download them as one ZIP", key="export_all"):
+                snapshot_history()
+                progress = st.progress(0.0, text="Rendering all formats...")
+                
+                def show_progress(done, total, export_name):
+                    progress.progress(done / total, text=f"{export_name} done ({done}/{total})")
+                
+                zip_bytes, errors = export_all_formats(
+                    st.session_state.raw_output,
+                    get_export_settings(),
+                    index=get_equation_index(st.session_state.raw_output),
+                    on_progress=show_progress,
+                    formats=[name for name in EXPORT_ALL_FORMATS if name not in blocked_exports],
+                )
+                b64 = base64.b64encode(zip_bytes).decode()
+                href = f'<a href="data:application/zip;base64,{b64}" download="converted_markdown_all_formats.zip" class="export-button">Download All Formats (ZIP)</a>'
+                st.markdown(href, unsafe_allow_html=True)
+                if blocked_exports:
+                    st.info(f"Skipped {', '.join(blocked_exports)} because the equations have errors.")
+                if errors:
+                    st.warning("Some formats could not be exported: " + ", ".join(f"{name} ({error})" for name, error in errors.items()))
+                else:
+                    st.success("All formats ready for download! Click the button above to save the ZIP.")
+            
             # Additional export options or settings
             with st.expander("Advanced Export Settings", expanded=False):
                 st.markdown("### Export Format Settings")
@@ -989,9 +3393,35 @@ Another display equation:
                 st.markdown("#### PDF and Image Settings")
                 col1, col2 = st.columns(2)
                 with col1:
-                    page_size = st.selectbox("Page Size", ["A4", "Letter", "Legal", "Tabloid"], index=0)
+                    st.selectbox("Page Size", list(PAGE_SIZES_PX), index=0, key="export_page_size")
+                    st.selectbox("Export Theme", list(EXPORT_THEMES), index=0, key="export_theme")
                 with col2:
-                    orientation = st.radio("Orientation", ["Portrait", "Landscape"], horizontal=True)
+                    st.radio("Orientation", ["Portrait", "Landscape"], horizontal=True, key="export_orientation")
+                
+                col1, col2, col3 = st.columns(3)
+                with col1:
+                    st.selectbox("Image Format", list(IMAGE_FORMATS), index=2, key="image_format")
+                with col2:
+                    st.selectbox("Image Quality", list(IMAGE_PRESETS), index=1, key="image_preset")
+                with col3:
+                    st.radio("Image Layout", ["Single image", "Page sequence (ZIP)"], key="image_layout")
+                
+                st.checkbox(
+                    "Render long PDFs in parallel sections",
+                    key="export_pdf_parallel",
+                    disabled=not pdf_merge_available(),
+                    help="Split documents at top-level headings and render the sections on all cores "
+                         "(each section starts on a new page; requires pypdf)",
+                )
+                
+                st.markdown("#### HTML Settings")
+                st.checkbox(
+                    "Self-contained HTML (works offline)",
+                    key="export_self_contained",
+                    disabled=not mathjax_available(),
+                    help="Inline MathJax and only the math fonts the document uses into the exported page"
+                    if mathjax_available() else "Needs the local MathJax bundle: run python vendor_mathjax.py",
+                )
                 
                 st.markdown("#### Markdown Settings")
                 preserve_newlines = st.checkbox("Preserve extra newlines", value=True)
@@ -1038,6 +3468,7 @@ Another display equation:
             with clear_btn_col1:
                 if st.button("🗑️ Clear History", key="clear_history"):
                     st.session_state.history = []
+                    st.session_state.pop("history_head", None)
                     st.rerun()
             
             # Search history
@@ -1054,33 +3485,196 @@ Another display equation:
             </style>
             """, unsafe_allow_html=True)
             
-            # Display history entries with filtering
-            for i, entry in enumerate(reversed(st.session_state.history)):
+            full_copies = sum(1 for entry in st.session_state.history if "input" in entry)
+            st.caption(
+                f"Stored as {full_copies} full copies and {len(st.session_state.history) - full_copies} line deltas "
+                f"({estimate_size(st.session_state.history) / 1024:.0f} KB)"
+            )
+            
+            # Display history entries with filtering, rebuilding each one from its deltas
+            for i, (entry, entry_input, entry_output) in enumerate(reversed(list(iter_history(st.session_state.history)))):
                 # Apply search filter if there's a search term
-                if search_term and search_term.lower() not in entry['input'].lower() and search_term.lower() not in entry['output'].lower():
+                if search_term and search_term.lower() not in entry_input.lower() and search_term.lower() not in entry_output.lower():
                     continue
                     
                 with st.expander(f"🕒 {entry['timestamp']} - {entry['input_preview']}", expanded=False):
                     st.markdown("**Input:**")
-                    st.code(entry['input'], language="latex")
+                    st.code(entry_input, language="latex")
                     
                     st.markdown("**Output:**")
-                    st.code(entry['output'], language="markdown")
+                    st.code(entry_output, language="markdown")
                     
                     # Action buttons for this history entry
                     col1, col2 = st.columns(2)
                     with col1:
                         if st.button(f"📋 Load This Entry", key=f"load_{i}"):
-                            st.session_state.user_input = entry['input']
-                            st.session_state.raw_output = entry['output']
+                            snapshot_history()
+                            st.session_state.user_input = entry_input
+                            st.session_state.raw_output = entry_output
+                            st.session_state.converted_input = entry_input
+                            st.session_state.pending_since = None
                             st.rerun()
                     with col2:
                         if st.button(f"🗑️ Remove Entry", key=f"remove_{i}"):
                             reversed_index = len(st.session_state.history) - 1 - i
                             if 0 <= reversed_index < len(st.session_state.history):
-                                st.session_state.history.pop(reversed_index)
+                                remove_history_entry(reversed_index)
                                 st.rerun()
         
+    # Equations tab
+    with tab3:
+        st.markdown('<div class="section-title">Equations</div>', unsafe_allow_html=True)
+        
+        document = st.session_state.get("raw_output", "")
+        equation_index = get_equation_index(document)
+        
+        if not len(equation_index):
+            st.info("No equations found yet. Convert some LaTeX to list its equations here.")
+        else:
+            counts = equation_index.counts()
+            st.write(f"{len(equation_index)} equations, {len(equation_index.texts)} unique:")
+            
+            # One row per unique equation, in order of first appearance
+            first_kind = {}
+            for text_id, kind in zip(equation_index.text_ids, equation_index.kinds):
+                first_kind.setdefault(text_id, kind)
+            equations_df = pd.DataFrame({
+                "Equation": [text.strip() for text in equation_index.texts],
+                "Kind": ["Display" if first_kind[i] == EQ_DISPLAY else "Inline" for i in range(len(equation_index.texts))],
+                "Occurrences": [counts[i] for i in range(len(equation_index.texts))],
+            })
+            
+            eq_filter = st.text_input("🔍 Filter equations", placeholder="Type to filter by LaTeX source...")
+            if eq_filter:
+                equations_df = equations_df[equations_df["Equation"].str.contains(eq_filter, regex=False)]
+            st.dataframe(equations_df, height=300)
+            
+            # Jump to every occurrence of the selected equation
+            if len(equations_df):
+                selected = st.selectbox(
+                    "Jump to equation",
+                    equations_df.index,
+                    format_func=lambda i: equations_df.at[i, "Equation"][:80],
+                )
+                st.latex(equation_index.texts[selected])
+                for start, end in equation_index.occurrences(selected):
+                    line = document.count("\n", 0, start) + 1
+                    context = document[max(0, start - 80):end + 80]
+                    st.markdown(f"**Line {line}**")
+                    st.code(context, language="markdown")
+    
+    # Large file tab: converted on the server and paged, never loaded into the editor
+    with tab4:
+        st.markdown('<div class="section-title">Convert a Large File</div>', unsafe_allow_html=True)
+        st.caption(
+            "Upload a .md, .txt or .tex file, or the conversations.json of a ChatGPT export. "
+            "It is converted on the server in chunks; download the result or page through it here."
+        )
+        
+        uploaded = st.file_uploader("Choose a file", type=list(UPLOAD_EXTENSIONS))
+        if uploaded is not None and st.button("🚀 Convert File", key="convert_upload"):
+            discard_upload_result(st.session_state.get("upload_result"))
+            st.session_state.upload_result = None
+            progress = st.progress(0.0, text=f"Converting {uploaded.name}...")
+            last_update = [0.0]
+            
+            def show_progress(fraction):
+                # Throttle updates so a long conversion doesn't flood the browser
+                now = time.time()
+                if now - last_update[0] >= 0.2 or fraction >= 1.0:
+                    last_update[0] = now
+                    progress.progress(fraction, text=f"Converting {uploaded.name}... {fraction:.0%}")
+            
+            try:
+                started = time.time()
+                st.session_state.upload_result = convert_uploaded_file(uploaded, on_progress=show_progress)
+                st.session_state.upload_page = 0
+                st.success(f"Converted {uploaded.name} in {time.time() - started:.1f}s")
+            except Exception as e:
+                st.error(f"Error converting file: {e}")
+            progress.empty()
+        
+        result = st.session_state.get("upload_result")
+        if result and not os.path.exists(result["path"]):
+            st.session_state.upload_result = result = None
+            st.info("The converted file has expired. Please convert it again.")
+        
+        if result:
+            with open(result["path"], "rb") as f:
+                st.download_button(
+                    f"⬇️ Download {result['filename']} ({result['bytes'] / 1e6:.1f} MB)",
+                    data=f,
+                    file_name=result["filename"],
+                    mime=result["mime"],
+                    key="download_upload",
+                )
+            
+            is_export = result["members"] is not None
+            page_count = len(result["members"]) if is_export else len(result["pages"])
+            if page_count:
+                if is_export:
+                    page = st.selectbox(
+                        f"Conversation ({page_count})",
+                        range(page_count),
+                        format_func=lambda i: result["members"][i],
+                    )
+                else:
+                    page = st.number_input(f"Page (of {page_count})", min_value=1, max_value=page_count,
+                                           value=min(st.session_state.get("upload_page", 0) + 1, page_count)) - 1
+                    st.session_state.upload_page = page
+                
+                page_text = read_upload_page(result, page)
+                view = st.radio("View", ["Rendered", "Markdown"], horizontal=True, key="upload_view")
+                with st.container(height=600):
+                    if view == "Rendered":
+                        st.markdown(page_text)
+                    else:
+                        st.code(page_text, language="markdown")
+    
+    # Account for this session's memory and evict if it is over the cap
+    session_bytes = enforce_session_memory_cap()
+    
+    # Memory admin view, only with ?admin=<LATEX_CONVERTER_ADMIN_TOKEN>
+    if ADMIN_TOKEN and st.query_params.get("admin") == ADMIN_TOKEN:
+        with st.expander("🛠️ Admin: Memory Usage", expanded=True):
+            registry = session_registry_snapshot()
+            rss = get_process_rss()
+            total_tracked = sum(info["bytes"] for info in registry.values())
+            
+            col1, col2, col3 = st.columns(3)
+            col1.metric("Active sessions", len(registry))
+            col2.metric("Session state total", f"{total_tracked / 1e6:.1f} MB")
+            col3.metric("Process RSS", f"{rss / 1e6:.1f} MB" if rss else "n/a")
+            st.caption(f"Per-session cap: {SESSION_MAX_BYTES / 1e6:.1f} MB · this session: {session_bytes / 1e6:.2f} MB")
+            try:
+                cache_stats = get_shared_cache().stats()
+                st.caption(
+                    f"Shared cache ({cache_stats['backend']}): {cache_stats['entries']} entries, "
+                    f"{cache_stats['bytes'] / 1e6:.1f} MB"
+                )
+            except Exception as e:
+                st.caption(f"Shared cache unavailable: {e}")
+            prerender_stats = get_prerenderer().stats
+            st.caption(
+                f"Pre-rendering: {prerender_stats['rendered']} rendered, {prerender_stats['already_cached']} already cached, "
+                f"{prerender_stats['cancelled']} cancelled, {prerender_stats['busy'] + prerender_stats['over_budget']} skipped "
+                f"for load or budget, {prerender_stats['cpu_seconds']:.1f} CPU s "
+                f"+ {prerender_stats['renderer_seconds']:.1f} s in renderers · load {system_load():.2f}/core"
+            )
+            
+            sessions_df = pd.DataFrame([
+                {
+                    "Session": session_id[:8],
+                    "MB": round(info["bytes"] / 1e6, 2),
+                    "Largest key": info["largest_key"],
+                    "History entries": info["history_entries"],
+                    "Evictions": info["evictions"],
+                    "Last seen (s ago)": int(time.time() - info["last_seen"]),
+                }
+                for session_id, info in sorted(registry.items(), key=lambda item: -item[1]["bytes"])
+            ])
+            st.dataframe(sessions_df)
+    
     # Footer with improved styling
     footer_bg_color = "#f8f9fa" if st.session_state.theme == "light" else "#1a1a1a"
     footer_text_color = "#666" if st.session_state.theme == "light" else "#999"
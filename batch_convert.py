@@ -0,0 +1,268 @@
+"""
+Command-line batch conversion for files too large to paste into the app.
+
+    python batch_convert.py jsonl transcripts.jsonl converted.jsonl --field messages.*.content
+    python batch_convert.py chatgpt export.zip notes/ --since 2024-01-01 --title calculus
+    python batch_convert.py watch docs/ converted/ --formats HTML,PDF
+"""
+import argparse
+import ctypes
+import datetime
+import os
+import select
+import struct
+import sys
+import time
+
+import streamlit.logger
+
+# Importing app outside `streamlit run` logs bare-mode warnings we don't need here
+streamlit.logger.set_log_level("error")
+
+from app import (
+    EXPORT_ALL_FORMATS,
+    convert_jsonl_file,
+    import_chatgpt_export,
+    load_watch_manifest,
+    reconcile_watch_folder,
+    save_watch_manifest,
+    sync_watched_file,
+    WATCH_EXTENSIONS,
+)
+
+# inotify(7) event flags
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+EVENT_HEADER = struct.Struct("iIII")
+# Changes are processed once the tree has been quiet for this long
+WATCH_SETTLE_SECONDS = 0.5
+
+
+def run_jsonl(args):
+    """Convert a field of every record in a JSONL file."""
+    started = time.time()
+    stats = convert_jsonl_file(
+        args.input,
+        args.output,
+        field=args.field,
+        workers=args.workers,
+        range_size=args.range_mb * 1024 * 1024,
+    )
+    elapsed = time.time() - started
+    print(
+        f"{stats['records']} records, {stats['converted']} converted, "
+        f"{stats['errors']} malformed, {stats['bytes'] / 1e6:.1f} MB in {elapsed:.1f}s"
+    )
+    return 0
+
+
+def run_chatgpt(args):
+    """Convert the conversations of a ChatGPT data export to Markdown files."""
+    started = time.time()
+    stats = import_chatgpt_export(
+        args.export,
+        args.output,
+        archive=args.archive,
+        since=args.since,
+        until=args.until,
+        title_filter=args.title,
+    )
+    elapsed = time.time() - started
+    print(
+        f"{stats['conversations']} conversations, {stats['written']} written, "
+        f"{stats['skipped']} filtered out in {elapsed:.1f}s"
+    )
+    return 0
+
+
+class Inotify:
+    """Recursive directory watch on Linux inotify, without third-party packages."""
+
+    def __init__(self, root, skip_dir=None):
+        self.libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.skip_dir = os.path.abspath(skip_dir) if skip_dir else None
+        self.paths = {}
+        self.add_tree(root)
+
+    def add_tree(self, top):
+        for root, dirs, _ in os.walk(top):
+            dirs[:] = [d for d in dirs if self._wanted(os.path.join(root, d))]
+            self.add(root)
+
+    def add(self, path):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd >= 0:
+            self.paths[wd] = path
+
+    def _wanted(self, path):
+        return os.path.abspath(path) != self.skip_dir and not os.path.basename(path).startswith(".")
+
+    def read(self, timeout):
+        """Wait up to timeout seconds and return (path, mask) events, watching new directories as they appear."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, name_len = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + name_len].rstrip(b"\0"))
+            offset += name_len
+            if mask & IN_Q_OVERFLOW:
+                events.append((None, mask))
+                continue
+            if wd not in self.paths:
+                continue
+            path = os.path.join(self.paths[wd], name) if name else self.paths[wd]
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO) and self._wanted(path):
+                self.add_tree(path)
+            if mask & IN_DELETE_SELF:
+                self.paths.pop(wd, None)
+            events.append((path, mask))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+def run_watch(args):
+    """Keep an output folder in sync with a source folder, re-converting only changed files."""
+    source_dir = os.path.abspath(args.source)
+    output_dir = os.path.abspath(args.output)
+    # The output may live inside the source (it is skipped), but not the other way round:
+    # converting would write into the watched tree and trigger itself
+    real_source, real_output = os.path.realpath(source_dir), os.path.realpath(output_dir)
+    if real_source == real_output:
+        print("The output folder must differ from the source folder")
+        return 2
+    if os.path.commonpath([real_source, real_output]) == real_output:
+        print(f"The source folder {source_dir} is inside the output folder {output_dir}")
+        return 2
+    formats = [name.strip() for name in args.formats.split(",") if name.strip()] if args.formats else []
+    unknown = [name for name in formats if name not in EXPORT_ALL_FORMATS]
+    if unknown:
+        print(f"Unknown formats: {', '.join(unknown)} (choose from {', '.join(EXPORT_ALL_FORMATS)})")
+        return 2
+
+    def report(rel_path, outcome):
+        print(f"{datetime.datetime.now():%H:%M:%S} {outcome:<9} {rel_path}", flush=True)
+
+    # Startup: compare the tree with the manifest instead of re-processing it
+    manifest = load_watch_manifest(output_dir)
+    started = time.time()
+    stats = reconcile_watch_folder(source_dir, output_dir, manifest, formats, on_file=report)
+    save_watch_manifest(output_dir, manifest)
+    print(
+        f"Reconciled in {time.time() - started:.1f}s: "
+        + ", ".join(f"{count} {outcome}" for outcome, count in sorted(stats.items())),
+        flush=True,
+    )
+    if args.once:
+        return 0
+
+    if not sys.platform.startswith("linux"):
+        print("File-change notifications need Linux; polling instead.", flush=True)
+        while True:
+            time.sleep(args.poll_interval)
+            reconcile_watch_folder(source_dir, output_dir, manifest, formats, on_file=report)
+            save_watch_manifest(output_dir, manifest)
+
+    watcher = Inotify(source_dir, skip_dir=output_dir)
+    print(f"Watching {source_dir} (Ctrl+C to stop)", flush=True)
+    try:
+        changed = set()
+        full_rescan = False
+        while True:
+            events = watcher.read(WATCH_SETTLE_SECONDS if changed or full_rescan else None)
+            for path, mask in events:
+                if path is None:
+                    full_rescan = True  # Kernel queue overflowed; events were lost
+                elif path.endswith(WATCH_EXTENSIONS) and not os.path.basename(path).startswith("."):
+                    changed.add(os.path.relpath(path, source_dir))
+                elif mask & IN_ISDIR:
+                    full_rescan = True  # A directory appeared or went away
+
+            if events or not (changed or full_rescan):
+                continue  # Wait for the burst to settle
+
+            if full_rescan:
+                reconcile_watch_folder(source_dir, output_dir, manifest, formats, on_file=report)
+            else:
+                for rel_path in sorted(changed):
+                    try:
+                        outcome = sync_watched_file(source_dir, output_dir, rel_path, manifest, formats)
+                    except Exception as e:
+                        outcome = f"failed: {e}"
+                    if outcome != "unchanged":
+                        report(rel_path, outcome)
+            save_watch_manifest(output_dir, manifest)
+            changed.clear()
+            full_rescan = False
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        watcher.close()
+
+
+def parse_date(value):
+    return datetime.datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Batch LaTeX to Markdown conversion")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    jsonl = commands.add_parser("jsonl", help="Convert a JSON field in every record of a JSONL file")
+    jsonl.add_argument("input", help="Input JSONL file")
+    jsonl.add_argument("output", help="Output JSONL file (records keep their input order)")
+    jsonl.add_argument("--field", default="content",
+                       help="Dotted path of the field to convert; use * for every list item (default: content)")
+    jsonl.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    jsonl.add_argument("--range-mb", type=int, default=64, help="Byte range per work item in MB (default: 64)")
+    jsonl.set_defaults(handler=run_jsonl)
+
+    chatgpt = commands.add_parser("chatgpt", help="Convert a ChatGPT data export to Markdown")
+    chatgpt.add_argument("export", help="conversations.json or the export ZIP that contains it")
+    chatgpt.add_argument("output", help="Output directory, or ZIP file with --archive")
+    chatgpt.add_argument("--archive", action="store_true", help="Write all conversations into one ZIP archive")
+    chatgpt.add_argument("--since", type=parse_date, help="Only conversations created on or after YYYY-MM-DD")
+    chatgpt.add_argument("--until", type=parse_date, help="Only conversations created on or before YYYY-MM-DD")
+    chatgpt.add_argument("--title", help="Only conversations whose title contains this text")
+    chatgpt.set_defaults(handler=run_chatgpt)
+
+    watch = commands.add_parser("watch", help="Keep a folder of converted files in sync with a source folder")
+    watch.add_argument("source", help=f"Folder of {', '.join(WATCH_EXTENSIONS)} files to watch")
+    watch.add_argument("output", help="Folder for converted Markdown, exports and the manifest")
+    watch.add_argument("--formats", default="",
+                       help=f"Comma-separated exports to produce as well: {', '.join(EXPORT_ALL_FORMATS)}")
+    watch.add_argument("--once", action="store_true", help="Reconcile once and exit instead of watching")
+    watch.add_argument("--poll-interval", type=float, default=5.0,
+                       help="Seconds between rescans where file notifications are unavailable (default: 5)")
+    watch.set_defaults(handler=run_watch)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
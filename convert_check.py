@@ -0,0 +1,71 @@
+"""
+Check that the linear delimiter scanner converts exactly what the original lazy
+regexes did, with and without collecting diagnostics, over a generated corpus of
+delimiter-heavy inputs and any files given.
+
+    python convert_check.py --cases 30000 --seed 0
+    python convert_check.py notes/*.txt
+"""
+import argparse
+import random
+import re
+import sys
+
+import streamlit.logger
+
+# Importing app outside `streamlit run` logs bare-mode warnings we don't need here
+streamlit.logger.set_log_level("error")
+
+from app import convert_latex_to_markdown
+
+# Pieces the inputs are assembled from: delimiters, their halves and look-alikes
+ALPHABET = ["\\", "(", ")", "[", "]", "{", "}", "$", "a", " ", "\n", "\\(", "\\)", "\\[", "\\]", "\\left(", "\\right)"]
+
+
+def reference_convert(text):
+    """convert_latex_to_markdown as it was before the scanner: two lazy regex substitutions."""
+    text = re.sub(r'\\\[(.*?)\\\]', r'$$\1$$', text, flags=re.DOTALL)
+    return re.sub(r'\\\((.*?)\\\)', r'$\1$', text, flags=re.DOTALL)
+
+
+def generate_cases(cases, seed):
+    rng = random.Random(seed)
+    for _ in range(cases):
+        yield "".join(rng.choice(ALPHABET) for _ in range(rng.randint(0, 40)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the delimiter scanner with the original regexes")
+    parser.add_argument("files", nargs="*", help="Text files to check as well")
+    parser.add_argument("--cases", type=int, default=30000, help="Generated inputs to check (default: 30000)")
+    parser.add_argument("--seed", type=int, default=0, help="Corpus random seed (default: 0)")
+    parser.add_argument("--show", type=int, default=3, help="Mismatches to print in full (default: 3)")
+    args = parser.parse_args(argv)
+
+    texts = list(generate_cases(args.cases, args.seed))
+    for path in args.files:
+        with open(path, encoding="utf-8") as f:
+            texts.append(f.read())
+
+    mismatches = 0
+    for text in texts:
+        expected = reference_convert(text)
+        # Collecting diagnostics takes a different path through the scanner
+        actual = convert_latex_to_markdown(text)
+        with_diagnostics = convert_latex_to_markdown(text, [])
+        if actual == expected and with_diagnostics == expected:
+            continue
+        mismatches += 1
+        if mismatches <= args.show:
+            print(repr(text))
+            print(f"  regexes:          {expected!r}")
+            print(f"  scanner:          {actual!r}")
+            print(f"  with diagnostics: {with_diagnostics!r}")
+            print()
+
+    print(f"{len(texts)} inputs, {mismatches} mismatches")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,339 @@
+"""
+Concurrent-session load test for app.py, driven headlessly through Streamlit's AppTest.
+
+Each simulated session replays a script of keystroke bursts, example loads,
+history operations and exports against its own copy of the app, and the
+harness reports per-rerun latency, throughput, memory growth and error rates
+as concurrency rises.
+
+    python load_test.py --concurrency 1,2,4,8 --iterations 5 --stub-renderers
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+
+import streamlit.logger
+
+streamlit.logger.set_log_level("error")
+
+from streamlit.testing.v1 import AppTest
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+
+# Text typed into the editor, a few characters per simulated keystroke event
+TYPED_TEXT = """Newton's second law \\(F = ma\\) relates force and acceleration.
+
+The Gaussian integral:
+\\[
+\\int_{-\\infty}^{\\infty} e^{-x^2} \\, dx = \\sqrt{\\pi}
+\\]
+
+Euler's identity \\(e^{i\\pi} + 1 = 0\\) and the sum \\(\\sum_{n=1}^{\\infty} \\frac{1}{n^2} = \\frac{\\pi^2}{6}\\).
+"""
+
+# Widget key prefix of the st_ace editor in app.py, followed by the editor generation
+EDITOR_KEY_PREFIX = "input_area_"
+
+EXPORT_KEYS = [
+    "export_html",
+    "export_markdown",
+    "export_pdf",
+    "export_image",
+    "export_latex",
+    "export_word",
+    "export_plain text",
+]
+
+
+def install_stub_renderers():
+    """Replace wkhtmltopdf and the headless browser with fast in-process stand-ins."""
+    import pdfkit
+    from html2image import Html2Image
+    from PIL import Image, ImageDraw
+
+    def fake_pdf(html, output_path=None, *args, **kwargs):
+        data = b"%PDF-1.4\n% load-test stub\n%%EOF\n"
+        if output_path:
+            with open(output_path, "wb") as f:
+                f.write(data)
+            return True
+        return data
+
+    def fake_init(self, output_path=None, size=(900, 1200), **kwargs):
+        # The real constructor looks for a Chrome executable
+        self.output_path = output_path or os.getcwd()
+        self.size = size
+
+    def fake_screenshot(self, url=None, save_as="screenshot.png", size=None, **kwargs):
+        # There is no height probe and only the first strip has content, so tiled
+        # exports stop after one strip
+        with open(url, encoding="utf-8") as f:
+            first_tile = "top: -0px" in f.read()
+        width, height = size or self.size
+        img = Image.new("RGB", (width, height), "white")
+        if first_tile:
+            ImageDraw.Draw(img).text((20, 20), "load-test stub", fill="black")
+        img.save(os.path.join(self.output_path, save_as))
+        return [save_as]
+
+    pdfkit.from_string = fake_pdf
+    Html2Image.__init__ = fake_init
+    Html2Image.screenshot = fake_screenshot
+
+
+def share_runtime_between_sessions():
+    """
+    AppTest installs a mock Runtime before each run and clears it afterwards.
+    Keep the most recent one reachable so sessions running in parallel threads
+    don't lose it when another session's run finishes.
+    """
+    from streamlit.runtime import Runtime
+
+    original = Runtime.instance.__func__
+    latest = {}
+
+    def instance(cls):
+        if cls._instance is not None:
+            latest["runtime"] = cls._instance
+            return cls._instance
+        if "runtime" in latest:
+            return latest["runtime"]
+        return original(cls)
+
+    Runtime.instance = classmethod(instance)
+
+
+def share_script_bytecode():
+    """
+    AppTest compiles the script again on every run, and concurrent compiles on CPython
+    3.11 can fail with "AST constructor recursion depth mismatch". Compile app.py once,
+    under a lock, and give every session the same bytecode.
+    """
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+
+    original = ScriptCache.get_bytecode
+    lock = threading.Lock()
+    compiled = {}
+
+    def get_bytecode(self, script_path):
+        with lock:
+            if script_path not in compiled:
+                compiled[script_path] = original(self, script_path)
+            return compiled[script_path]
+
+    ScriptCache.get_bytecode = get_bytecode
+
+
+class SessionStats:
+    """Latencies and failures collected by one simulated session."""
+
+    def __init__(self):
+        self.latencies = []
+        self.steps = 0
+        self.exceptions = 0
+        self.app_errors = 0
+        self.failures = []  # "step: error" for each failed step, reported after the run
+
+    def fail(self, name, error):
+        self.exceptions += 1
+        self.failures.append(f"{name}: {error}")
+
+
+def scripted_step(at, stats, timeout, name, action=None):
+    """
+    Perform one scripted action and the rerun it triggers, recording the rerun's latency.
+    A failing action, a raising or empty rerun or an exception shown by the app all count
+    as an exception for this session; the session carries on with its next step.
+    """
+    stats.steps += 1
+    try:
+        if action is not None:
+            action()
+        started = time.perf_counter()
+        at.run(timeout=timeout)
+        stats.latencies.append(time.perf_counter() - started)
+    except Exception as e:
+        stats.fail(name, f"{type(e).__name__}: {e}")
+        return
+    if len(at.exception):
+        stats.fail(name, at.exception[0].message)
+    elif not at.main.children:
+        stats.fail(name, "the run rendered nothing (script compilation or runner failure)")
+    if len(at.error):
+        stats.app_errors += 1
+
+
+def editor_key(at):
+    """Widget key of the editor the app drew on its last run."""
+    generation = at.session_state["editor_generation"] if "editor_generation" in at.session_state else 0
+    return f"{EDITOR_KEY_PREFIX}{generation}"
+
+
+def replace_editor_content(at, button_key):
+    """
+    Click a button that replaces the editor content. The editor's own value is dropped
+    so it picks up what the app sets, as the browser component does.
+    """
+    at.button(key=button_key).click()
+    if editor_key(at) in at.session_state:
+        del at.session_state[editor_key(at)]
+
+
+def pause_typing(at):
+    """Move the pending edit back past the latency budget, as if the user had stopped typing."""
+    pause = at.session_state["latency_budget_ms"] / 1000
+    for key in ("last_edit_time", "pending_since"):
+        if key in at.session_state and at.session_state[key] is not None:
+            at.session_state[key] -= pause
+
+
+def type_text(at, text):
+    at.session_state[editor_key(at)] = text
+
+
+def has_history(at):
+    return "history" in at.session_state and bool(at.session_state["history"])
+
+
+def run_session(session_num, iterations, keystroke_chars, timeout, stats):
+    """Replay the scripted session against a fresh copy of the app."""
+    rng = random.Random(session_num)
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    scripted_step(at, stats, timeout, "first run")
+
+    for _ in range(iterations):
+        # Load the example
+        scripted_step(at, stats, timeout, "use example", lambda: replace_editor_content(at, "use_example"))
+
+        # Keystroke stream: each burst of characters is one editor rerun, converted
+        # only when the debounce allows
+        for pos in range(0, len(TYPED_TEXT), keystroke_chars):
+            text = TYPED_TEXT[:pos + keystroke_chars]
+            scripted_step(at, stats, timeout, "keystrokes", lambda: type_text(at, text))
+
+        # The pause after typing: the conversion timer's rerun converts the text
+        scripted_step(at, stats, timeout, "pause", lambda: pause_typing(at))
+
+        # Export in a random format
+        export_key = rng.choice(EXPORT_KEYS)
+        scripted_step(at, stats, timeout, export_key, lambda: at.button(key=export_key).click())
+
+        # History operations
+        if has_history(at):
+            scripted_step(at, stats, timeout, "load history", lambda: replace_editor_content(at, "load_0"))
+        if rng.random() < 0.2:
+            scripted_step(at, stats, timeout, "clear history", lambda: at.button(key="clear_history").click())
+
+
+def run_session_safely(session_num, iterations, keystroke_chars, timeout, stats):
+    """run_session, recording anything that escapes it instead of ending the thread silently."""
+    try:
+        run_session(session_num, iterations, keystroke_chars, timeout, stats)
+    except Exception as e:
+        stats.fail("session", f"{type(e).__name__}: {e}")
+
+
+def read_rss():
+    """Resident memory of this process in bytes (Linux), or 0 if unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def run_level(concurrency, args):
+    """Run `concurrency` sessions at once and summarise the results."""
+    sessions = [SessionStats() for _ in range(concurrency)]
+    threads = [
+        threading.Thread(
+            target=run_session_safely,
+            args=(num, args.iterations, args.keystroke_chars, args.timeout, stats),
+        )
+        for num, stats in enumerate(sessions)
+    ]
+
+    rss_before = read_rss()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    rss_after = read_rss()
+
+    latencies = [latency for stats in sessions for latency in stats.latencies]
+    runs = len(latencies)
+    steps = sum(s.steps for s in sessions)
+    return {
+        "concurrency": concurrency,
+        "runs": runs,
+        "throughput": runs / elapsed if elapsed else 0.0,
+        "p50": percentile(latencies, 50) * 1000,
+        "p90": percentile(latencies, 90) * 1000,
+        "p99": percentile(latencies, 99) * 1000,
+        "mean": statistics.mean(latencies) * 1000 if latencies else 0.0,
+        "exception_rate": sum(s.exceptions for s in sessions) / steps if steps else 0.0,
+        "app_error_rate": sum(s.app_errors for s in sessions) / steps if steps else 0.0,
+        "failures": [f"session {num}, {failure}" for num, s in enumerate(sessions) for failure in s.failures],
+        "rss_growth_mb": (rss_after - rss_before) / 1e6,
+        "rss_mb": rss_after / 1e6,
+    }
+
+
+def print_report(results):
+    header = (
+        f"{'sessions':>8} {'reruns':>7} {'reruns/s':>9} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} "
+        f"{'mean ms':>8} {'exc %':>6} {'err %':>6} {'RSS +MB':>8} {'RSS MB':>8}"
+    )
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(
+            f"{r['concurrency']:>8} {r['runs']:>7} {r['throughput']:>9.1f} {r['p50']:>8.1f} {r['p90']:>8.1f} "
+            f"{r['p99']:>8.1f} {r['mean']:>8.1f} {r['exception_rate'] * 100:>6.1f} "
+            f"{r['app_error_rate'] * 100:>6.1f} {r['rss_growth_mb']:>8.1f} {r['rss_mb']:>8.1f}"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent-session load test for app.py")
+    parser.add_argument("--concurrency", default="1,2,4,8",
+                        help="Comma-separated numbers of simultaneous sessions (default: 1,2,4,8)")
+    parser.add_argument("--iterations", type=int, default=3, help="Script repetitions per session (default: 3)")
+    parser.add_argument("--keystroke-chars", type=int, default=40,
+                        help="Characters typed between editor reruns (default: 40)")
+    parser.add_argument("--timeout", type=float, default=120, help="Seconds allowed per rerun (default: 120)")
+    parser.add_argument("--stub-renderers", action="store_true",
+                        help="Stub out wkhtmltopdf and html2image so exports don't need them installed")
+    args = parser.parse_args(argv)
+
+    share_runtime_between_sessions()
+    share_script_bytecode()
+    if args.stub_renderers:
+        install_stub_renderers()
+
+    results = []
+    for level in [int(n) for n in args.concurrency.split(",") if n.strip()]:
+        results.append(run_level(level, args))
+        print_report(results[-1:])
+        for failure in results[-1]["failures"]:
+            print(f"  failed: {failure}")
+    print()
+    print_report(results)
+    return 1 if any(r["failures"] for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
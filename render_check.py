@@ -0,0 +1,95 @@
+"""
+Check that the block-by-block Markdown renderer produces exactly what rendering the
+whole document at once does, over a generated corpus and any files given.
+
+    python render_check.py --documents 3000 --seed 0
+    python render_check.py notes/*.md
+"""
+import argparse
+import difflib
+import random
+import sys
+
+import markdown
+import streamlit.logger
+
+# Importing app outside `streamlit run` logs bare-mode warnings we don't need here
+streamlit.logger.set_log_level("error")
+
+from app import _markdown_to_html
+
+# Blocks the corpus is assembled from: lists at several indents, indented and fenced
+# code, display equations with blank lines, definition lists, quotes and tables
+SNIPPETS = [
+    "# Heading",
+    "## Subheading",
+    "A paragraph with $x^2$ inline.",
+    "A *paragraph*\nover two lines.",
+    "Lazy\ncontinuation line",
+    "  Two-space indented paragraph",
+    "   Three-space indented paragraph",
+    "- item",
+    "* star item",
+    "- first\n- second",
+    "  - two-space item",
+    "    - four-space item",
+    "1. numbered",
+    "2) numbered with parenthesis",
+    "1. item\n\n    paragraph in the item",
+    "    indented code",
+    "\tTab-indented code",
+    "```\nfenced\n\ncode\n```",
+    "$$\na = b\n$$",
+    "$$\nx\n\ny\n$$",
+    "> quote",
+    "> - quoted item",
+    "Term\n: definition",
+    ": another definition",
+    "| a | b |\n|---|---|\n| 1 | 2 |",
+    "---",
+]
+
+
+def whole_render(text):
+    return markdown.markdown(text, extensions=['extra', 'codehilite'])
+
+
+def generate_corpus(documents, seed):
+    rng = random.Random(seed)
+    for _ in range(documents):
+        yield "\n\n".join(rng.choice(SNIPPETS) for _ in range(rng.randint(1, 12)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare block-by-block and whole-document Markdown rendering")
+    parser.add_argument("files", nargs="*", help="Markdown files to check as well")
+    parser.add_argument("--documents", type=int, default=3000, help="Generated documents to check (default: 3000)")
+    parser.add_argument("--seed", type=int, default=0, help="Corpus random seed (default: 0)")
+    parser.add_argument("--show", type=int, default=3, help="Mismatches to print in full (default: 3)")
+    args = parser.parse_args(argv)
+
+    documents = list(generate_corpus(args.documents, args.seed))
+    for path in args.files:
+        with open(path, encoding="utf-8") as f:
+            documents.append(f.read())
+
+    mismatches = 0
+    for text in documents:
+        expected = whole_render(text)
+        actual = _markdown_to_html(text)
+        if actual == expected:
+            continue
+        mismatches += 1
+        if mismatches <= args.show:
+            print(repr(text))
+            print("\n".join(difflib.unified_diff(
+                expected.splitlines(), actual.splitlines(), "whole document", "block by block", lineterm="", n=1,
+            )))
+            print()
+
+    print(f"{len(documents)} documents, {mismatches} mismatches")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
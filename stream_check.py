@@ -0,0 +1,89 @@
+"""
+Check that streaming conversion gives exactly what converting the whole text at once
+does, however the text is split into chunks, over a generated corpus and any files given.
+
+    python stream_check.py --cases 20000 --seed 0
+    python stream_check.py --carry 16 notes/*.txt
+"""
+import argparse
+import random
+import sys
+
+import streamlit.logger
+
+# Importing app outside `streamlit run` logs bare-mode warnings we don't need here
+streamlit.logger.set_log_level("error")
+
+import app
+
+# Pieces the inputs are assembled from: delimiters, their halves and look-alikes
+ALPHABET = ["\\", "(", ")", "[", "]", "a", "\n", "$", "\\(", "\\)", "\\[", "\\]"]
+
+
+def generate_cases(cases, seed):
+    rng = random.Random(seed)
+    for _ in range(cases):
+        yield "".join(rng.choice(ALPHABET) for _ in range(rng.randint(0, 40)))
+
+
+def random_chunks(text, rng, max_cuts=6):
+    """Split text at up to max_cuts random points, which may fall inside a delimiter."""
+    cuts = sorted(rng.sample(range(len(text) + 1), min(len(text) + 1, rng.randint(0, max_cuts))))
+    return [text[start:end] for start, end in zip([0] + cuts, cuts + [len(text)])]
+
+
+def has_long_pair(text, carry):
+    """Whether an opener's closer is further than carry characters away, which streaming leaves unconverted."""
+    for opener, closer in (("\\[", "\\]"), ("\\(", "\\)")):
+        start = text.find(opener)
+        while start != -1:
+            end = text.find(closer, start + len(opener))
+            if end == -1:
+                break
+            if end + len(closer) - start > carry:
+                return True
+            start = text.find(opener, end + len(closer))
+    return False
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare streaming and whole-text LaTeX conversion")
+    parser.add_argument("files", nargs="*", help="Text files to check as well")
+    parser.add_argument("--cases", type=int, default=20000, help="Generated inputs to check (default: 20000)")
+    parser.add_argument("--seed", type=int, default=0, help="Corpus and chunking random seed (default: 0)")
+    parser.add_argument("--carry", type=int, default=app.STREAM_MAX_CARRY,
+                        help=f"STREAM_MAX_CARRY to test with (default: {app.STREAM_MAX_CARRY})")
+    parser.add_argument("--show", type=int, default=3, help="Mismatches to print in full (default: 3)")
+    args = parser.parse_args(argv)
+
+    app.STREAM_MAX_CARRY = args.carry
+    rng = random.Random(args.seed)
+    texts = list(generate_cases(args.cases, args.seed))
+    for path in args.files:
+        with open(path, encoding="utf-8") as f:
+            texts.append(f.read())
+
+    mismatches = skipped = 0
+    for text in texts:
+        # Pairs longer than the carry are the documented difference from whole-text conversion
+        if has_long_pair(text, args.carry):
+            skipped += 1
+            continue
+        chunks = random_chunks(text, rng)
+        expected = app.convert_latex_to_markdown(text)
+        actual = "".join(app.convert_latex_stream(iter(chunks)))
+        if actual == expected:
+            continue
+        mismatches += 1
+        if mismatches <= args.show:
+            print(repr(chunks))
+            print(f"  whole text: {expected!r}")
+            print(f"  streamed:   {actual!r}")
+            print()
+
+    print(f"{len(texts) - skipped} inputs ({skipped} skipped for the carry limit), {mismatches} mismatches")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+"""
+Vendor MathJax into static/ so exports typeset equations without reaching a CDN.
+
+    python vendor_mathjax.py                              # download the release from GitHub
+    python vendor_mathjax.py --archive MathJax-2.7.7.zip  # air-gapped hosts: use a copied archive
+
+Only what the app's configuration needs is kept: MathJax.js, the combined configuration
+(plain and -full), the TeX/MathML/AsciiMath input, CommonHTML output, extensions and the
+WOFF web fonts. Streamlit serves the result at /app/static/mathjax/<version>/ when
+static serving is enabled (see .streamlit/config.toml).
+"""
+import argparse
+import io
+import os
+import shutil
+import sys
+import tempfile
+import urllib.request
+import zipfile
+
+import streamlit.logger
+
+# Importing app outside `streamlit run` logs bare-mode warnings we don't need here
+streamlit.logger.set_log_level("error")
+
+from app import MATHJAX_CONFIG, MATHJAX_DIR, MATHJAX_VERSION
+
+ARCHIVE_URL = f"https://github.com/mathjax/MathJax/archive/refs/tags/{MATHJAX_VERSION}.zip"
+# Paths inside the release to keep; entries ending in / keep the whole directory
+KEEP = (
+    "MathJax.js",
+    f"config/{MATHJAX_CONFIG}.js",
+    f"config/{MATHJAX_CONFIG}-full.js",
+    "jax/input/TeX/",
+    "jax/input/MathML/",
+    "jax/input/AsciiMath/",
+    "jax/output/CommonHTML/",
+    "jax/output/PreviewHTML/",
+    "jax/element/",
+    "extensions/",
+    "fonts/HTML-CSS/TeX/woff/",
+)
+REQUIRED = ("MathJax.js", f"config/{MATHJAX_CONFIG}-full.js")
+
+
+def wanted(rel_path):
+    return any(rel_path == keep or (keep.endswith("/") and rel_path.startswith(keep)) for keep in KEEP)
+
+
+def read_archive(args):
+    if args.archive:
+        with open(args.archive, "rb") as f:
+            return f.read()
+    print(f"Downloading {args.url}", flush=True)
+    with urllib.request.urlopen(args.url, timeout=args.timeout) as response:
+        return response.read()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=f"Vendor MathJax {MATHJAX_VERSION} into {MATHJAX_DIR}")
+    parser.add_argument("--archive", help="Use this release ZIP instead of downloading it")
+    parser.add_argument("--url", default=ARCHIVE_URL, help=f"Release ZIP to download (default: {ARCHIVE_URL})")
+    parser.add_argument("--timeout", type=float, default=60, help="Download timeout in seconds (default: 60)")
+    args = parser.parse_args(argv)
+
+    try:
+        data = read_archive(args)
+    except OSError as e:
+        print(f"Could not get the MathJax release: {e}")
+        return 1
+
+    parent = os.path.dirname(MATHJAX_DIR)
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=".mathjax-", dir=parent)
+    try:
+        files = 0
+        size = 0
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            for info in archive.infolist():
+                # Release archives have a single top-level directory, e.g. MathJax-2.7.7/
+                rel_path = info.filename.split("/", 1)[-1]
+                if info.is_dir() or not wanted(rel_path):
+                    continue
+                target = os.path.join(staging, *rel_path.split("/"))
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with archive.open(info) as src, open(target, "wb") as dst:
+                    shutil.copyfileobj(src, dst)
+                files += 1
+                size += info.file_size
+
+        missing = [path for path in REQUIRED if not os.path.exists(os.path.join(staging, path))]
+        if missing:
+            print(f"Not a MathJax {MATHJAX_VERSION} release archive (missing {', '.join(missing)})")
+            return 1
+
+        # Swap the new bundle in whole so the app never sees a half-written one: move the
+        # old bundle aside, move the new one in, and only then delete the old one
+        previous = None
+        if os.path.exists(MATHJAX_DIR):
+            previous = tempfile.mkdtemp(prefix=".mathjax-old-", dir=parent)
+            os.rmdir(previous)
+            os.replace(MATHJAX_DIR, previous)
+        try:
+            os.replace(staging, MATHJAX_DIR)
+        except OSError:
+            if previous:
+                os.replace(previous, MATHJAX_DIR)
+            raise
+        if previous:
+            shutil.rmtree(previous, ignore_errors=True)
+    finally:
+        if os.path.exists(staging):
+            shutil.rmtree(staging)
+
+    print(f"Vendored MathJax {MATHJAX_VERSION}: {files} files, {size / 1e6:.1f} MB in {MATHJAX_DIR}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())